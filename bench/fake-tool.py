@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# Stand-in for mock, rpm, and the csdiff tools, which run-bench.py puts on
+# $PATH (as symlinks named by the tool to emulate).  Nothing is executed in
+# any chroot, the tools only produce plausible output of configurable size
+# after a configurable delay.  The behavior is controlled by these variables:
+#
+#   CSMOCK_BENCH_LATENCY      delay of each start of mock [s]
+#   CSMOCK_BENCH_CMD_LATENCY  delay of each command run by mock [s]
+#   CSMOCK_BENCH_OUTPUT       number of bytes that mock writes to stderr
+#   CSMOCK_BENCH_PACKAGES     number of packages reported by rpm -qa
+#   CSMOCK_BENCH_DEFECTS      number of defects added by the first cslinker
+
+import io
+import json
+import os
+import re
+import sys
+import tarfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import synth
+
+
+def env_num(name, default):
+    return type(default)(os.environ.get(name, default))
+
+
+def write_noise():
+    size = env_num("CSMOCK_BENCH_OUTPUT", 4096)
+    line = "DEBUG: fake mock output line of a typical length, padded to 80 chars ........\n"
+    sys.stderr.write(line * (size // len(line)))
+    sys.stderr.flush()
+
+
+def pkg_query(count):
+    """output of RpmIndex.query_cmd()"""
+    out = ""
+    for i in range(count):
+        out += "@ 1 pkg%d 0 1.%d 1.fc40 x86_64\npkg%d = 1.%d-1.fc40\nlibpkg%d.so.1()(64bit)\n" \
+                % (i, i, i, i, i)
+    return out
+
+
+def run_chroot_cmd(cmd, stdin, stdout):
+    """emulate the output of a command executed in the chroot"""
+    time.sleep(env_num("CSMOCK_BENCH_CMD_LATENCY", 0.001))
+    if cmd.startswith("rpm -qa"):
+        stdout.write(pkg_query(env_num("CSMOCK_BENCH_PACKAGES", 500)).encode())
+    elif cmd.startswith("tar -c"):
+        tarfile.open(fileobj=stdout, mode="w|").close()
+    elif cmd.startswith("csgrep"):
+        stdout.write(stdin.read())
+    elif re.match("^(tar -x|dd of=)", cmd):
+        stdin.read()
+    elif "--version" in cmd:
+        stdout.write(b"fake 1.0\n")
+
+
+def mock_session():
+    """emulate a shell started by MockWrapper.open_session()"""
+    for line in sys.stdin.buffer:
+        line = line.decode()
+        m = re.search("printf '\\\\n(\\S+) %d\\\\n'", line)
+        if m is None:
+            continue
+        cmd = re.sub("^\\(eval '(.*)'\\) </dev/null.*$", "\\1", line.rstrip("\n"))
+        # the commands have their stdin redirected from /dev/null
+        run_chroot_cmd(cmd.replace("'\\''", "'"), io.BytesIO(), sys.stdout.buffer)
+        sys.stdout.write("\n%s 0\n" % m.group(1))
+        sys.stdout.flush()
+
+
+def fake_mock(argv):
+    time.sleep(env_num("CSMOCK_BENCH_LATENCY", 0.2))
+    write_noise()
+    for (i, arg) in enumerate(argv):
+        if arg in ["--shell", "--chroot"] and i + 1 < len(argv):
+            if argv[i + 1] == "exec /bin/sh -s":
+                mock_session()
+            else:
+                run_chroot_cmd(argv[i + 1], sys.stdin.buffer, sys.stdout.buffer)
+            break
+        if arg == "--debug-config":
+            sys.stdout.write("config_opts['root'] = 'fake'\n")
+            break
+    return 0
+
+
+def fake_rpm(argv):
+    args = " ".join(argv)
+    if "-qa" in argv:
+        for i in range(env_num("CSMOCK_BENCH_PACKAGES", 500)):
+            print("pkg%d-1.%d-1.fc40.x86_64" % (i, i))
+    elif "--requires" in argv:
+        # all of them are provided by the fake chroot
+        for i in range(25):
+            print("pkg%d" % i)
+            print("libpkg%d.so.1()(64bit)" % (i + 25))
+    elif re.search("-[a-z]*l[a-z]*p|-[a-z]*p[a-z]*l", args):
+        print("pkg.spec")
+    else:
+        srpm = [a for a in argv if a.endswith(".rpm")]
+        print(re.sub("\\.src\\.rpm$", "", os.path.basename(srpm[0])) if srpm else "pkg")
+    return 0
+
+
+def load(fname):
+    data = sys.stdin.read() if fname in [None, "-"] else open(fname).read()
+    try:
+        return json.loads(data) if data.strip() else {"defects": []}
+    except ValueError:
+        # not a JSON file (e.g. empty.err)
+        return {"defects": []}
+
+
+def dump(js):
+    json.dump(js, sys.stdout, indent=4)
+    sys.stdout.write("\n")
+
+
+def input_file(argv):
+    """return the last argument that names an existing file (or stdin)"""
+    files = [a for a in argv if a == "-" or (not a.startswith("-") and os.path.isfile(a))]
+    return files[-1] if files else None
+
+
+def fake_csgrep(argv):
+    js = load(input_file(argv))
+    mode = "grep"
+    for arg in argv:
+        if arg.startswith("--mode="):
+            mode = arg[len("--mode="):]
+    if mode == "json":
+        dump(js)
+    elif mode == "evtstat":
+        stats = {}
+        for d in js["defects"]:
+            stats[d["checker"]] = stats.get(d["checker"], 0) + 1
+        for (chk, cnt) in sorted(stats.items()):
+            print("%8d\t%s" % (cnt, chk))
+    else:
+        for d in js["defects"]:
+            print("Error: %s:" % d["checker"])
+            for e in d["events"]:
+                print("%s:%s: %s: %s" % (e["file_name"], e.get("line", 0), e["event"], e["message"]))
+            print("")
+    return 0
+
+
+def fake_cslinker(argv):
+    scan = {}
+    inputs = []
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg in ["--cwelist", "--implist"]:
+            args.pop(0)
+        elif arg == "--inifile":
+            with open(args.pop(0)) as f:
+                for line in f:
+                    (key, sep, val) = line.partition(" = ")
+                    if sep:
+                        scan[key.strip()] = val.strip()
+        elif arg == "-" or not arg.startswith("-"):
+            inputs.append(arg)
+
+    defects = []
+    for fname in inputs:
+        defects += load(fname)["defects"]
+    if "--cwelist" in argv:
+        # the first cslinker of a scan merges the raw results
+        defects += synth.make_defects(env_num("CSMOCK_BENCH_DEFECTS", 1000))
+    dump({"scan": scan, "defects": defects})
+    return 0
+
+
+def fake_csdiff(argv):
+    files = [a for a in argv if a == "-" or not a.startswith("-")]
+
+    def key(d):
+        return (d["checker"], d["events"][d.get("key_event_idx", 0)]["message"])
+
+    (old, new) = (load(files[0]), load(files[1]))
+    if "--fixed" in argv:
+        (old, new) = (new, old)
+    old_keys = set(key(d) for d in old["defects"])
+    dump({"scan": new.get("scan", {}),
+          "defects": [d for d in new["defects"] if key(d) not in old_keys]})
+    return 0
+
+
+def fake_cssort(argv):
+    dump(load(input_file(argv)))
+    return 0
+
+
+def fake_cshtml(argv):
+    js = load(input_file(argv))
+    print("<html><body>%d defects</body></html>" % len(js["defects"]))
+    return 0
+
+
+TOOLS = {
+    "mock":     fake_mock,
+    "rpm":      fake_rpm,
+    "csgrep":   fake_csgrep,
+    "cslinker": fake_cslinker,
+    "csdiff":   fake_csdiff,
+    "cssort":   fake_cssort,
+    "cshtml":   fake_cshtml}
+
+
+if __name__ == "__main__":
+    tool = os.path.basename(sys.argv[0])
+    if tool not in TOOLS:
+        sys.stderr.write("%s: unknown tool to emulate\n" % tool)
+        sys.exit(1)
+    sys.exit(TOOLS[tool](sys.argv[1:]))
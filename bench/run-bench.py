@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmarks of csmock's own overhead, which run from the source tree on any
+# Linux box.  The scan scenarios drive do_scan() and do_diff_scan() with mock,
+# rpm, and the csdiff tools replaced by fake-tool.py and report the time spent
+# in each phase and the number of executed commands.  The pipelines scenario
+# measures processing of synthetic lists of defects in-process.
+
+import argparse
+import importlib.machinery
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+TOP_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(TOP_DIR, "py")
+
+FAKE_TOOLS = ["mock", "rpm", "csgrep", "cslinker", "csdiff", "cssort", "cshtml"]
+
+SCENARIOS = ["scan", "diff-scan", "pipelines"]
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+sys.path.insert(0, BENCH_DIR)
+import synth
+
+
+def prepare_env(work_dir, args):
+    """put the fake tools on $PATH and csmock from the source tree on $PYTHONPATH"""
+    bin_dir = os.path.join(work_dir, "bin")
+    os.mkdir(bin_dir)
+    for tool in FAKE_TOOLS:
+        os.symlink(os.path.join(BENCH_DIR, "fake-tool.py"), os.path.join(bin_dir, tool))
+
+    py_dir = os.path.join(work_dir, "python")
+    os.mkdir(py_dir)
+    os.symlink(SRC_DIR, os.path.join(py_dir, "csmock"))
+    sys.path.insert(0, py_dir)
+
+    os.environ["PATH"] = "%s:%s" % (bin_dir, os.environ.get("PATH", "/usr/bin:/bin"))
+    os.environ["PYTHONPATH"] = py_dir
+    os.environ["CSMOCK_BENCH_LATENCY"] = str(args.latency)
+    os.environ["CSMOCK_BENCH_CMD_LATENCY"] = str(args.cmd_latency)
+    os.environ["CSMOCK_BENCH_OUTPUT"] = str(args.output_bytes)
+    os.environ["CSMOCK_BENCH_PACKAGES"] = str(args.packages)
+    os.environ["CSMOCK_BENCH_DEFECTS"] = str(args.defects)
+    return bin_dir
+
+
+def load_csmock():
+    """import the csmock script from the source tree as a module"""
+    loader = importlib.machinery.SourceFileLoader("csmock_main", os.path.join(SRC_DIR, "csmock"))
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def run_forked(fn, log_file):
+    """run fn() in a forked process with stdout/stderr appended to log_file,
+    return its exit code"""
+    pid = os.fork()
+    if pid == 0:
+        fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        ec = 1
+        try:
+            ec = fn()
+        except BaseException:
+            traceback.print_exc()
+        os._exit(ec)
+
+    (_, status) = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def make_props(csmock, work_dir, bin_dir, args):
+    srpm = os.path.join(work_dir, "pkg-1.0-1.src.rpm")
+    if not os.path.exists(srpm):
+        with open(srpm, "wb") as f:
+            f.write(os.urandom(1 << 20))
+
+    props = csmock.ScanProps()
+    props.mock_profile = "fake"
+    props.base_mock_profile = "fake"
+    props.mock_cmd = os.path.join(bin_dir, "mock")
+    props.srpm = srpm
+    props.base_srpm = srpm
+    props.nvr = "pkg-1.0-1"
+    props.cache_dir = os.path.join(work_dir, "cache")
+    props.copy_in_files = [os.path.join(TOP_DIR, "scripts")]
+    props.host_buildrequires = False
+    props.known_false_positives = None
+    props.chroot_session = args.chroot_session
+    props.trace = True
+    return props
+
+
+def make_args(args):
+    return argparse.Namespace(
+        embed_context=0,
+        skip_patches=False,
+        parallel_diff_scan=False,
+        diff_engine=args.diff_engine)
+
+
+def read_json(fname):
+    with open(fname) as f:
+        return json.load(f)
+
+
+def count_cmds(trace_files):
+    """return (number of commands, number of mock processes) in the traces"""
+    cmds = 0
+    mocks = 0
+    for fname in trace_files:
+        for ev in read_json(fname)["traceEvents"]:
+            if ev.get("cat") not in ["cmd", "chroot"]:
+                continue
+            cmds += 1
+            if ev["cat"] == "cmd" and ev["name"].startswith("mock"):
+                mocks += 1
+    return (cmds, mocks)
+
+
+def bench_scan(csmock, work_dir, bin_dir, args, diff):
+    name = "diff-scan" if diff else "scan"
+    best = None
+    for run in range(args.runs):
+        output = os.path.join(work_dir, "%s-%d" % (name, run))
+        props = make_props(csmock, work_dir, bin_dir, args)
+        scan_args = make_args(args)
+        if diff:
+            ec = run_forked(lambda: csmock.do_diff_scan(props, output, scan_args, False),
+                            args.log_file)
+            profile = read_json(os.path.join(output, "profile.json"))
+            traces = [os.path.join(output, "trace.json")] + [
+                os.path.join(output, run_dir, "debug", "trace.json")
+                for run_dir in ["run0", "run1"]]
+        else:
+            ec = run_forked(lambda: csmock.do_scan(props, output, scan_args, False),
+                            args.log_file)
+            profile = read_json(os.path.join(output, "debug", "profile.json"))
+            traces = [os.path.join(output, "debug", "trace.json")]
+
+        (cmds, mocks) = count_cmds(traces)
+        result = {
+            "exit-code": ec,
+            "wall": profile["wall"],
+            "cpu": profile["cpu"],
+            "commands": cmds,
+            "mock-processes": mocks,
+            "phases": profile["phases"]}
+        if best is None or result["wall"] < best["wall"]:
+            best = result
+    return best
+
+
+def bench_pipelines(work_dir, sizes, out_file):
+    """measure processing of synthetic lists of defects of the given sizes,
+    write the results to out_file as JSON"""
+    from csmock.common.archive import write_archive
+    from csmock.common.defects import apply_filters
+    from csmock.common.defects import diff_results
+    from csmock.common.defects import write_ndjson
+    from csmock.common.defects import write_sqlite
+    from csmock.common.report import write_paged_html
+    from csmock.common.results import ScanResults
+    csmock = load_csmock()
+
+    codec = "zstd" if shutil.which("zstd") else "xz"
+    timings = {}
+    with ScanResults(os.path.join(work_dir, "pipelines"), "csmock-bench", "0",
+                     keep_going=True) as results:
+        for size in sizes:
+            base_dir = os.path.join(work_dir, "pipelines-data")
+            data_dir = os.path.join(base_dir, str(size))
+            os.makedirs(data_dir)
+            all_file = os.path.join(data_dir, "scan-results-all.js")
+            old_file = os.path.join(data_dir, "scan-results-old.js")
+            js_file = os.path.join(data_dir, "scan-results.js")
+            synth.write_defects(all_file, size, seed=0)
+            synth.write_defects(old_file, size, seed=1)
+
+            row = {}
+            timings[size] = row
+
+            def measure(name, fn):
+                results.print_with_ts("bench: %s (%d defects)" % (name, size))
+                t0 = time.time()
+                fn()
+                row[name] = round(time.time() - t0, 3)
+
+            measure("filter", lambda: apply_filters(
+                results, csmock.DEFAULT_RESULT_FILTERS, all_file, js_file))
+            measure("ndjson", lambda: write_ndjson(js_file))
+            measure("sqlite", lambda: write_sqlite(js_file))
+            measure("paged-html", lambda: write_paged_html(
+                js_file, os.path.join(data_dir, "scan-results.html")))
+            measure("diff", lambda: diff_results(
+                results, old_file, js_file,
+                os.path.join(data_dir, "fixed.js"), os.path.join(data_dir, "added.js"),
+                os.path.join(data_dir, "unchanged.js"), ignore_path=True))
+            measure("archive-" + codec, lambda: write_archive(
+                os.path.join(base_dir, "%d.tar.%s" % (size, codec)), base_dir, str(size), codec))
+            shutil.rmtree(data_dir)
+
+    with open(out_file, "w") as f:
+        json.dump(timings, f)
+    return 0
+
+
+def print_scan(name, result):
+    print("%s: wall %.2f s, cpu %.2f s, %d commands (%d mock processes), exit code %d" % (
+        name, result["wall"], result["cpu"], result["commands"],
+        result["mock-processes"], result["exit-code"]))
+    print("    %-48s %9s %9s" % ("phase", "wall [s]", "cpu [s]"))
+    for phase in result["phases"]:
+        label = "  " * phase["depth"] + phase["name"]
+        print("    %-48s %9.3f %9.3f" % (label[:48], phase.get("wall", 0), phase.get("cpu", 0)))
+    print("")
+
+
+def print_pipelines(timings):
+    sizes = sorted(timings, key=int)
+    names = list(timings[sizes[0]].keys())
+    print("pipelines [s]:")
+    print("    %10s" % "defects" + "".join(" %12s" % n for n in names))
+    for size in sizes:
+        print("    %10s" % size + "".join(" %12.3f" % timings[size][n] for n in names))
+    print("")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure overhead of csmock itself with mock and the csdiff tools \
+replaced by fake stand-ins.")
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS),
+        help="comma-separated list of scenarios to run (defaults to %s)" % ",".join(SCENARIOS))
+    parser.add_argument(
+        "--sizes", default=DEFAULT_SIZES,
+        help="comma-separated numbers of defects for the pipelines scenario \
+(defaults to %s)" % DEFAULT_SIZES)
+    parser.add_argument(
+        "--defects", type=int, default=1000,
+        help="number of defects reported by the scan scenarios (defaults to 1000)")
+    parser.add_argument(
+        "--latency", type=float, default=0.2,
+        help="delay of each start of mock [s] (defaults to 0.2)")
+    parser.add_argument(
+        "--cmd-latency", type=float, default=0.001,
+        help="delay of each command executed by mock [s] (defaults to 0.001)")
+    parser.add_argument(
+        "--output-bytes", type=int, default=4096,
+        help="number of bytes logged by each start of mock (defaults to 4096)")
+    parser.add_argument(
+        "--packages", type=int, default=500,
+        help="number of packages installed in the fake chroot (defaults to 500)")
+    parser.add_argument(
+        "--chroot-session", action="store_true",
+        help="run the scans with --chroot-session")
+    parser.add_argument(
+        "--diff-engine", choices=["csdiff", "native"], default="csdiff",
+        help="--diff-engine of the diff-scan scenario (defaults to csdiff)")
+    parser.add_argument(
+        "--runs", type=int, default=1,
+        help="number of runs of each scan scenario, the fastest one is reported")
+    parser.add_argument(
+        "--json",
+        help="write the results also to the given file as JSON")
+    parser.add_argument(
+        "--keep", action="store_true",
+        help="do not remove the working directory (with logs and scan results)")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error("unknown scenario: %s" % scenario)
+    sizes = [int(n) for n in args.sizes.split(",")]
+
+    work_dir = tempfile.mkdtemp(prefix="csmock-bench")
+    args.log_file = os.path.join(work_dir, "bench.log")
+    bin_dir = prepare_env(work_dir, args)
+    csmock = load_csmock()
+
+    report = {}
+    try:
+        for scenario in scenarios:
+            if scenario == "pipelines":
+                out_file = os.path.join(work_dir, "pipelines.json")
+                ec = run_forked(lambda: bench_pipelines(work_dir, sizes, out_file),
+                                args.log_file)
+                if ec != 0:
+                    sys.stderr.write("pipelines failed, see %s\n" % args.log_file)
+                    args.keep = True
+                    continue
+                report[scenario] = read_json(out_file)
+                print_pipelines(report[scenario])
+            else:
+                report[scenario] = bench_scan(csmock, work_dir, bin_dir, args,
+                                              diff=(scenario == "diff-scan"))
+                print_scan(scenario, report[scenario])
+                if report[scenario]["exit-code"] != 0:
+                    args.keep = True
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=1)
+    finally:
+        if args.keep:
+            print("results and logs kept in %s" % work_dir)
+        else:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
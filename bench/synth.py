@@ -0,0 +1,83 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# synthetic lists of defects in the JSON format of csdiff
+
+import json
+import random
+
+CHECKERS = [
+    ("GCC_WARNING", "gcc", "warning[-Wunused-variable]", "unused variable 'x%d'", 563),
+    ("CLANG_WARNING", "clang", "warning[core.NullDereference]", "Dereference of null pointer%d", 476),
+    ("CPPCHECK_WARNING", "cppcheck", "error[memleak]", "Memory leak: p%d", 401),
+    ("SHELLCHECK_WARNING", "shellcheck", "warning[SC2086]", "Double quote to prevent globbing %d", 88),
+    ("RESOURCE_LEAK", "infer", "error", "resource of type FILE acquired by call to fopen() at line %d", 772)]
+
+# paths of the defects as they appear in the chroot (most of them are kept by
+# DEFAULT_RESULT_FILTERS of csmock, the others are filtered out)
+PATH_TPLS = [
+    "/builddir/build/BUILD/pkg-1.0/src/module%d.c",
+    "/builddir/build/BUILD/pkg-1.0/lib/util%d.c",
+    "/builddir/build/BUILD/pkg-1.0/tests/test%d.sh",
+    "/builddir/build/BUILD/pkg-1.0/CMakeFiles/CMakeTmp/conftest.c",
+    "/usr/include/stdio%d.h"]
+
+
+def make_defect(rnd, i):
+    (checker, tool, event, msg, cwe) = CHECKERS[i % len(CHECKERS)]
+    path = PATH_TPLS[rnd.randrange(len(PATH_TPLS))]
+    if "%d" in path:
+        path = path % rnd.randrange(200)
+    events = [{
+        "file_name": path,
+        "line": rnd.randrange(1, 5000),
+        "column": rnd.randrange(1, 80),
+        "event": event,
+        "message": msg % rnd.randrange(1000),
+        "verbosity_level": 0}]
+    for _ in range(rnd.randrange(3)):
+        events.append({
+            "file_name": path,
+            "line": rnd.randrange(1, 5000),
+            "event": "note",
+            "message": "called from here",
+            "verbosity_level": 1})
+    return {
+        "checker": checker,
+        "cwe": cwe,
+        "language": "c/c++",
+        "tool": tool,
+        "key_event_idx": 0,
+        "events": events}
+
+
+def make_defects(count, seed=0):
+    """return a list of count synthetic defects, the same for the same seed"""
+    rnd = random.Random(seed)
+    return [make_defect(rnd, i) for i in range(count)]
+
+
+def write_defects(fname, count, seed=0, scan=None):
+    """write count synthetic defects to fname, one defect per line"""
+    with open(fname, "w") as f:
+        f.write('{\n    "scan": %s,\n    "defects": [\n' % json.dumps(scan or {}))
+        rnd = random.Random(seed)
+        for i in range(count):
+            if i:
+                f.write(",\n")
+            f.write("        " + json.dumps(make_defect(rnd, i)))
+        f.write("\n    ]\n}\n")
@@ -136,10 +136,14 @@ Tool for plugging static analyzers into the build process, free of mock.
 
 %package -n csmock-common
 Summary: Core of csmock (a mock wrapper for Static Analysis tools)
+Requires: cpio
+Requires: createrepo_c
 Requires: csdiff > 1.8.0
 Requires: csgcca
 Requires: cswrap >= 1.3.1
 Requires: mock
+Requires: rpm-build
+Requires: zstd
 %if !(0%{?fedora} >= 19 || 0%{?rhel} >= 7)
 Requires: python-argparse
 Requires: python-importlib
@@ -244,7 +248,7 @@ This package contains the valgrind plug-in for csmock.
 
 # force using Python 3 Fedora 23+
 %if %{force_py3}
-sed -e '1s/python$/python3/' -i py/cs{build,mock}
+sed -e '1s/python$/python3/' -i py/cs{build,mock,mock-history}
 %endif
 
 %build
@@ -275,7 +279,9 @@ make install DESTDIR="\$RPM_BUILD_ROOT"
 %dir %{csmock_python_sitelib}/csmock
 %dir %{csmock_python_sitelib}/csmock/plugins
 %{_bindir}/csmock
+%{_bindir}/csmock-history
 %{_mandir}/man1/csmock.1*
+%{_mandir}/man1/csmock-history.1*
 %{_datadir}/csmock/cwe-map.csv
 %{_datadir}/csmock/scripts/chroot-fixups
 %{_datadir}/csmock/scripts/patch-rawbuild.sh
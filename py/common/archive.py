@@ -0,0 +1,332 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tar archives compressed in independent blocks (concatenated xz streams or
+# zstd frames), which can be compressed in parallel.  The archive ends with
+# an index of blocks and members, which makes it possible to read a single
+# member without decompressing the whole archive.  For xz, the index is stored
+# as a comment in a pax global header (which tar ignores) in the last stream,
+# which is found by the index of the xz stream in its footer.  For zstd, it is
+# stored in a skippable frame (which zstd ignores), followed by a skippable
+# frame holding the size of the former one.
+
+# standard imports
+import json
+import lzma
+import os
+import struct
+import subprocess
+import sys
+import tarfile
+import threading
+
+# size of uncompressed data compressed as a single block
+DEFAULT_BLOCK_SIZE = 16 << 20
+
+COMPRESSORS = {
+    "xz":   ["xz", "--compress", "--stdout", "--threads=1"],
+    "zstd": ["zstd", "--compress", "--stdout", "--quiet"]}
+
+DECOMPRESSORS = {
+    "xz":   ["xz", "--decompress", "--stdout"],
+    "zstd": ["zstd", "--decompress", "--stdout", "--quiet"]}
+
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+# magic numbers of the zstd skippable frames that hold the index and its size
+ZSTD_INDEX_MAGIC = 0x184D2A5C
+ZSTD_FOOTER_MAGIC = 0x184D2A5D
+
+# size of the footer of an xz stream
+XZ_FOOTER_SIZE = 12
+
+
+def run_filter(argv, data, trace=None, lane=0):
+    """run argv with data on its stdin, return its stdout; trace (if given) is
+    called as trace(argv, lane) right before argv is started and returns
+    a function that is called with the exit code of argv once it finishes"""
+    done = trace(argv, lane) if trace else None
+    proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    (out, _) = proc.communicate(data)
+    if done is not None:
+        done(proc.returncode)
+    if proc.returncode != 0:
+        raise IOError("%s exited with %d" % (argv[0], proc.returncode))
+    return out
+
+
+def compress(data, codec, trace=None, lane=0):
+    return run_filter(COMPRESSORS[codec], data, trace, lane)
+
+
+def decompress(data, codec, trace=None, lane=0):
+    return run_filter(DECOMPRESSORS[codec], data, trace, lane)
+
+
+class BlockWriter:
+    """file-like object that compresses data written to it in blocks, using
+    up to 'jobs' compressors in parallel, and stores them to out_file; the
+    compressors are passed to trace (see run_filter()) with lanes < jobs"""
+    def __init__(self, out_file, codec, jobs, block_size=DEFAULT_BLOCK_SIZE, trace=None):
+        self.out_file = out_file
+        self.codec = codec
+        self.trace = trace
+        self.free_lanes = list(range(jobs))
+        self.block_size = block_size
+        self.buf = bytearray()
+        self.size = 0
+        self.blocks = []
+        self.pending = []
+        self.sem = threading.Semaphore(jobs)
+        self.error = None
+
+    def tell(self):
+        return self.size
+
+    def write(self, data):
+        self.buf += data
+        self.size += len(data)
+        while len(self.buf) >= self.block_size:
+            self.submit(bytes(self.buf[:self.block_size]))
+            del self.buf[:self.block_size]
+
+    def submit(self, data):
+        # limit the number of blocks being compressed (and kept in memory)
+        self.sem.acquire()
+        self.flush_done()
+        result = {}
+        lane = self.free_lanes.pop(0)
+
+        def run():
+            try:
+                result["out"] = compress(data, self.codec, self.trace, lane)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                self.free_lanes.append(lane)
+                self.sem.release()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.pending.append((thread, len(data), result))
+
+    def flush_done(self, wait=False):
+        """write the compressed blocks to out_file in order"""
+        while self.pending:
+            (thread, size, result) = self.pending[0]
+            if thread.is_alive() and not wait:
+                break
+            thread.join()
+            self.pending.pop(0)
+            if "error" in result:
+                self.error = result["error"]
+                continue
+            self.out_file.write(result["out"])
+            self.blocks.append([len(result["out"]), size])
+
+    def flush(self):
+        """compress the buffered data as a (possibly shorter) block and wait
+        for all the blocks to be written"""
+        if self.buf:
+            self.submit(bytes(self.buf))
+            self.buf = bytearray()
+        self.flush_done(wait=True)
+
+    def close(self):
+        self.flush()
+        if self.error is not None:
+            raise self.error
+
+
+def write_archive(out_file, base_dir, name, codec, jobs=None, trace=None, last=None):
+    """write base_dir/name (recursively) into out_file as a tar archive
+    compressed by codec ("xz" or "zstd") in independent blocks; last (if given)
+    is called once the other members are compressed and returns paths of files
+    (not yet existing) to store at the end of the archive"""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # the blocks are written directly to a temporary file next to out_file,
+    # which replaces out_file once it is complete
+    tmp_file = "%s.%d" % (out_file, os.getpid())
+    members = {}
+    try:
+        with open(tmp_file, "wb") as f:
+            writer = BlockWriter(f, codec, jobs, trace=trace)
+            tar = tarfile.open(fileobj=writer, mode="w", format=tarfile.GNU_FORMAT)
+
+            def add(path):
+                arcname = os.path.relpath(path, base_dir)
+                tar.add(path, arcname=arcname, recursive=False)
+                tarinfo = tar.members[-1]
+                if tarinfo.isreg():
+                    # the data are padded to a multiple of the tar block size
+                    padded = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                    members[arcname] = [tar.offset - padded, tarinfo.size]
+                # do not keep all the TarInfo objects in memory
+                tar.members = []
+
+            # the top-level directory is stored last (after the index for xz) as
+            # some readers (e.g. Python's tarfile) need a member after pax headers
+            top_dir = os.path.join(base_dir, name)
+            for (dirpath, dirnames, filenames) in os.walk(top_dir):
+                dirnames.sort()
+                # os.walk() does not descend into symlinks to directories, which
+                # are listed in dirnames, store them as symlinks
+                links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+                paths = [os.path.join(dirpath, f) for f in sorted(filenames + links)]
+                if dirpath != top_dir:
+                    paths.insert(0, dirpath)
+                for path in paths:
+                    add(path)
+            if last is not None:
+                writer.flush()
+                for path in last():
+                    add(path)
+
+            def make_index():
+                return json.dumps({
+                    "format": 2,
+                    "codec": codec,
+                    "blocks": writer.blocks,
+                    "members": members}, separators=(",", ":"))
+
+            if codec == "zstd":
+                add(top_dir)
+                tar.close()
+                writer.close()
+                data = make_index().encode("utf8")
+                f.write(struct.pack("<II", ZSTD_INDEX_MAGIC, len(data)))
+                f.write(data)
+                f.write(struct.pack("<III", ZSTD_FOOTER_MAGIC, 4, 8 + len(data)))
+            else:
+                # the last stream holds the index and the end of the tar archive,
+                # keep them in a single block however large the index is
+                writer.flush()
+                writer.block_size = sys.maxsize
+                hdr = tarfile.TarInfo.create_pax_global_header({"comment": make_index()})
+                writer.write(hdr)
+                tar.offset += len(hdr)
+                add(top_dir)
+                tar.close()
+                writer.close()
+        os.rename(tmp_file, out_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def read_varint(data, pos):
+    """return (value, position after it) of a multibyte integer in xz format"""
+    value = 0
+    shift = 0
+    while True:
+        if len(data) <= pos:
+            raise ValueError("truncated archive")
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return (value, pos)
+        shift += 7
+
+
+def last_xz_stream(f):
+    """return the offset of the last xz stream in the file open in f"""
+    end = f.seek(0, os.SEEK_END)
+    if end < 2 * XZ_FOOTER_SIZE:
+        raise ValueError("not an indexed archive")
+    f.seek(end - XZ_FOOTER_SIZE)
+    footer = f.read(XZ_FOOTER_SIZE)
+    if footer[10:] != b"YZ":
+        raise ValueError("not an indexed archive")
+
+    # the index of the stream lists sizes of its blocks
+    index_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+    f.seek(end - XZ_FOOTER_SIZE - index_size)
+    index = f.read(index_size)
+    (cnt, pos) = read_varint(index, 1)
+    blocks_size = 0
+    for _ in range(cnt):
+        (unpadded, pos) = read_varint(index, pos)
+        (_, pos) = read_varint(index, pos)
+        blocks_size += -(-unpadded // 4) * 4
+
+    # stream header, blocks, index, stream footer
+    return end - XZ_FOOTER_SIZE - index_size - blocks_size - XZ_FOOTER_SIZE
+
+
+def read_index(f):
+    """return the index of an archive open in f"""
+    end = f.seek(0, os.SEEK_END)
+    if 12 <= end:
+        f.seek(end - 12)
+        (magic, _, size) = struct.unpack("<III", f.read(12))
+        if magic == ZSTD_FOOTER_MAGIC:
+            f.seek(end - 12 - size)
+            (magic, length) = struct.unpack("<II", f.read(8))
+            if magic != ZSTD_INDEX_MAGIC:
+                raise ValueError("not an indexed archive")
+            return json.loads(f.read(length).decode("utf8"))
+
+    f.seek(0)
+    if not f.read(len(XZ_MAGIC)) == XZ_MAGIC:
+        raise ValueError("not an indexed archive")
+
+    # decompress only the last xz stream
+    f.seek(last_xz_stream(f))
+    hdr = lzma.LZMADecompressor(format=lzma.FORMAT_XZ).decompress(f.read())
+
+    # parse records of the pax global header: "LENGTH KEYWORD=VALUE\n"
+    if len(hdr) < tarfile.BLOCKSIZE or hdr[156:157] != tarfile.XGLTYPE:
+        raise ValueError("not an indexed archive")
+    size = int(hdr[124:136].strip(b"\0 ") or b"0", 8)
+    records = hdr[tarfile.BLOCKSIZE:tarfile.BLOCKSIZE + size]
+    while records:
+        (length, _, rest) = records.partition(b" ")
+        length = int(length)
+        (key, _, value) = rest[:length - len(b"%d " % length) - 1].partition(b"=")
+        if key == b"comment":
+            return json.loads(value.decode("utf8"))
+        records = records[length:]
+    raise ValueError("not an indexed archive")
+
+
+def read_member(archive, name):
+    """return contents of the given member of an indexed archive, decompressing
+    only the blocks that contain it"""
+    with open(archive, "rb") as f:
+        index = read_index(f)
+        if name not in index["members"]:
+            raise KeyError(name)
+        (offset, size) = index["members"][name]
+
+        data = b""
+        comp_off = 0
+        data_off = 0
+        for (comp_size, data_size) in index["blocks"]:
+            if offset + size <= data_off:
+                break
+            if offset < data_off + data_size:
+                f.seek(comp_off)
+                block = decompress(f.read(comp_size), index["codec"])
+                start = max(offset - data_off, 0)
+                data += block[start:offset + size - data_off]
+            comp_off += comp_size
+            data_off += data_size
+        return data
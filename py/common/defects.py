@@ -0,0 +1,648 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# standard imports
+import collections
+import hashlib
+import io
+import json
+import os
+import re
+import shlex
+import sqlite3
+
+# local imports
+from csmock.common.util         import shell_quote
+from csmock.common.util         import strlist_to_shell_cmd
+
+
+def load_defects(fname):
+    """read a list of defects in the JSON format of csdiff"""
+    with io.open(fname, encoding="utf8") as f:
+        data = f.read()
+    if not data.strip():
+        # csgrep treats empty input as an empty list of defects
+        return collections.OrderedDict([("defects", [])])
+    return json.loads(data, object_pairs_hook=collections.OrderedDict)
+
+
+def dump_defects(data, fname):
+    """write a list of defects in (approximately) the JSON format of csdiff"""
+    text = json.dumps(data, indent=4, separators=(",", ": "), ensure_ascii=False)
+    with io.open(fname, "w", encoding="utf8") as f:
+        f.write(u"%s\n" % text)
+
+
+class JsonStreamReader:
+    """read values from a JSON document without loading it whole"""
+    def __init__(self, f, chunk_size=(1 << 20)):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = u""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
+
+    def fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """skip white-spaces and return the next character (None at EOF)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, chars):
+        c = self.peek()
+        if c is None or c not in chars:
+            raise ValueError("expected one of '%s' at offset %d" % (chars, self.pos))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                (val, end) = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return val
+            except ValueError:
+                if self.eof:
+                    raise
+            # the value may continue in the next chunk
+            self.fill()
+
+
+def iter_defects(fname):
+    """yield ("scan", SCAN) and ("defect", DEFECT) pairs read from a JSON file
+    in the format of csdiff, using memory proportional to a single defect"""
+    with io.open(fname, encoding="utf8") as f:
+        reader = JsonStreamReader(f)
+        if reader.peek() is None:
+            # empty input
+            return
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key == "defects":
+                reader.expect("[")
+                if reader.peek() == "]":
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield ("defect", reader.value())
+                        if reader.expect(",]") == "]":
+                            break
+            else:
+                val = reader.value()
+                if key == "scan":
+                    yield ("scan", val)
+            if reader.expect(",}") == "}":
+                return
+
+
+def read_scan_props(fname):
+    """return properties of the scan stored in a JSON file in the format of
+    csdiff, or None if there are none"""
+    for (kind, val) in iter_defects(fname):
+        if kind == "scan":
+            return val
+    return None
+
+
+def write_ndjson(js_file):
+    """write the list of defects as newline-delimited JSON next to js_file,
+    with the scan properties in the first record"""
+    nd_file = re.sub("\\.js$", ".ndjson", js_file)
+    header = None
+    with io.open(nd_file, "w", encoding="utf8") as f:
+        def write_record(val):
+            f.write(u"%s\n" % json.dumps(val, ensure_ascii=False, separators=(",", ":")))
+
+        for (kind, val) in iter_defects(js_file):
+            if header is None:
+                header = val if kind == "scan" else collections.OrderedDict()
+                write_record({"scan": header})
+            if kind == "defect":
+                write_record(val)
+
+        if header is None:
+            write_record({"scan": {}})
+    return nd_file
+
+
+def format_defect(defect):
+    """return the defect as text in the format of 'csgrep --mode=grep'"""
+    hdr = "Error: %s" % defect.get("checker", "")
+    if defect.get("cwe"):
+        hdr += " (CWE-%d)" % defect["cwe"]
+    lines = [hdr + ":"]
+    for evt in defect.get("events", []):
+        if evt.get("event") == "#":
+            # comment events hold lines of the source code
+            lines.append("#%s" % evt.get("message", ""))
+            continue
+        loc = evt.get("file_name", "")
+        for key in ["line", "column"]:
+            if evt.get(key):
+                loc += ":%d" % evt[key]
+        lines.append("%s: %s: %s" % (loc, evt.get("event", ""), evt.get("message", "")))
+    return "\n".join(lines) + "\n"
+
+
+def write_err(defects, err_file):
+    """write the defects into err_file in the format of 'csgrep --mode=grep'"""
+    with io.open(err_file, "w", encoding="utf8") as f:
+        f.write(u"\n".join(format_defect(d) for d in defects))
+
+
+def event_stats(defects):
+    """return the numbers of key events by checker and event as text in the
+    format of 'csgrep --mode=evtstat'"""
+    stats = collections.Counter(
+        (d.get("checker", ""), key_event(d).get("event", "")) for d in defects)
+    return "".join("%8d\t%s\t%s\n" % (stats[key], key[0], key[1]) for key in sorted(stats))
+
+
+def write_sqlite(js_file):
+    """write the list of defects into an indexed SQLite database next to js_file"""
+    db_file = re.sub("\\.js$", ".sqlite", js_file)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    db = sqlite3.connect(db_file)
+    db.executescript("""
+CREATE TABLE scan (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE defects (id INTEGER PRIMARY KEY, checker TEXT, cwe INTEGER,
+    imp INTEGER, tool TEXT, language TEXT, key_event_idx INTEGER,
+    key_event TEXT, path TEXT, line INTEGER, column INTEGER, message TEXT,
+    json TEXT);
+CREATE TABLE events (defect_id INTEGER REFERENCES defects(id), idx INTEGER,
+    event TEXT, file_name TEXT, line INTEGER, column INTEGER, message TEXT,
+    verbosity_level INTEGER, PRIMARY KEY (defect_id, idx));
+""")
+    def_id = 0
+    for (kind, val) in iter_defects(js_file):
+        if kind == "scan":
+            db.executemany("INSERT OR REPLACE INTO scan VALUES (?, ?)",
+                           [(k, "%s" % v) for (k, v) in val.items()])
+            continue
+
+        def_id += 1
+        evt = key_event(val)
+        db.execute("INSERT INTO defects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            def_id, val.get("checker"), val.get("cwe"), val.get("imp", 0),
+            val.get("tool"), val.get("language"), val.get("key_event_idx", 0),
+            evt.get("event"), evt.get("file_name"), evt.get("line"),
+            evt.get("column"), evt.get("message"),
+            json.dumps(val, ensure_ascii=False, separators=(",", ":"))))
+        db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            (def_id, idx, e.get("event"), e.get("file_name"), e.get("line"),
+             e.get("column"), e.get("message"), e.get("verbosity_level"))
+            for (idx, e) in enumerate(val.get("events", []))])
+
+    # create the indexes once all the data are inserted
+    db.executescript("""
+CREATE INDEX defects_checker ON defects (checker);
+CREATE INDEX defects_path ON defects (path);
+CREATE INDEX defects_cwe ON defects (cwe);
+CREATE INDEX defects_key_event ON defects (key_event);
+CREATE INDEX defects_imp ON defects (imp);
+""")
+    db.commit()
+    db.close()
+    return db_file
+
+
+def key_event(defect):
+    events = defect.get("events", [])
+    idx = defect.get("key_event_idx", 0)
+    if 0 <= idx < len(events):
+        return events[idx]
+    return {}
+
+
+class DefectFilter:
+    """declarative filter equivalent to 'csgrep --mode=json [OPTIONS]'"""
+    def __init__(self, checker=None, event=None, msg=None, path=None,
+                 invert_match=False, invert_regex=False, strip_path_prefix=None,
+                 remove_duplicates=False):
+        self.regexes = []
+        for (key, opt, val) in [
+                ("checker", "--checker", checker),
+                ("event", "--event", event),
+                ("message", "--msg", msg),
+                ("file_name", "--path", path)]:
+            if val is not None:
+                self.regexes.append((key, opt, val, re.compile(val)))
+        self.invert_match = invert_match
+        self.invert_regex = invert_regex
+        self.strip_path_prefix = strip_path_prefix
+        self.remove_duplicates = remove_duplicates
+
+    def matches(self, defect):
+        evt = key_event(defect)
+        for (key, _, _, regex) in self.regexes:
+            val = defect.get(key) if key == "checker" else evt.get(key)
+            found = regex.search(val or "") is not None
+            if found == self.invert_regex:
+                return self.invert_match
+        return not self.invert_match
+
+    def apply(self, defects):
+        # the same order as in csgrep: predicates, duplicates, path prefix
+        seen = set()
+        for defect in defects:
+            if not self.matches(defect):
+                continue
+            if self.remove_duplicates:
+                evt = key_event(defect)
+                key = (defect.get("checker"), evt.get("file_name"), evt.get("line"),
+                       evt.get("event"), evt.get("message"))
+                if key in seen:
+                    continue
+                seen.add(key)
+            if self.strip_path_prefix:
+                for evt in defect.get("events", []):
+                    fname = evt.get("file_name", "")
+                    if fname.startswith(self.strip_path_prefix):
+                        evt["file_name"] = fname[len(self.strip_path_prefix):]
+            yield defect
+
+    def to_shell(self):
+        cmd = ["csgrep", "--mode=json"]
+        if self.invert_match:
+            cmd += ["--invert-match"]
+        if self.invert_regex:
+            cmd += ["--invert-regex"]
+        for (_, opt, val, _) in self.regexes:
+            cmd += [opt, val]
+        if self.strip_path_prefix:
+            cmd += ["--strip-path-prefix", self.strip_path_prefix]
+        if self.remove_duplicates:
+            cmd += ["--remove-duplicates"]
+        return strlist_to_shell_cmd(cmd)
+
+
+def prune_events(defects, threshold):
+    """drop events with verbosity level at or above threshold, except the key
+    events, equivalent to 'csgrep --prune-events=THRESHOLD'"""
+    for defect in defects:
+        events = defect.get("events", [])
+        key_idx = defect.get("key_event_idx", 0)
+        keep = [i for (i, evt) in enumerate(events)
+                if i == key_idx or evt.get("verbosity_level", 0) < threshold]
+        if len(keep) < len(events):
+            defect["events"] = [events[i] for i in keep]
+            if key_idx in keep:
+                defect["key_event_idx"] = keep.index(key_idx)
+        yield defect
+
+
+class PathSubst:
+    """substitute the first match of regex in file names and messages of
+    all events, equivalent to 'sed s|REGEX|REPL|' on the JSON output of csdiff"""
+    def __init__(self, regex, repl):
+        self.regex = re.compile(regex)
+        self.pattern = regex
+        self.repl = repl
+
+    def apply(self, defects):
+        for defect in defects:
+            for evt in defect.get("events", []):
+                for key in ["file_name", "message"]:
+                    if key in evt:
+                        evt[key] = self.regex.sub(self.repl, evt[key], count=1)
+            yield defect
+
+    def to_shell(self):
+        return "sed %s" % shell_quote("s|%s|%s|" % (self.pattern, self.repl))
+
+
+def normalize_path(path):
+    """strip the build directory and the top-level directory of the sources,
+    which contains the version of the package, the way csdiff does"""
+    path = re.sub("^/builddir/build/BUILD/", "", path)
+    return re.sub("^/?[^/]+/", "", path)
+
+
+def defect_fingerprint(defect, ignore_path=False):
+    """return a key used to match defects of two scans, which approximates the
+    rules of csdiff: the checker, key event, file name (without the versioned
+    top-level directory, only its base name with ignore_path) and message,
+    where line numbers are not significant.  Missing fields are represented by
+    empty strings (which also makes the key usable in SQL comparisons)."""
+    evt = key_event(defect)
+    path = evt.get("file_name") or ""
+    if ignore_path:
+        path = os.path.basename(path)
+    else:
+        path = normalize_path(path)
+    msg = evt.get("message") or ""
+    msg = re.sub(":[0-9]+(:[0-9]+)?", ":", msg)
+    msg = re.sub("\\bline [0-9]+", "line", msg)
+    return (defect.get("checker") or "", evt.get("event") or "", path, msg)
+
+
+def diff_defects(old, new, ignore_path=False):
+    """return (fixed, added, unchanged) lists of defects given two lists, each
+    defect matches at most one defect with the same fingerprint in the other list"""
+    old_keys = [defect_fingerprint(d, ignore_path) for d in old]
+    new_keys = [defect_fingerprint(d, ignore_path) for d in new]
+
+    avail = collections.Counter(old_keys)
+    added = []
+    unchanged = []
+    for (key, defect) in zip(new_keys, new):
+        if 0 < avail[key]:
+            avail[key] -= 1
+            unchanged.append(defect)
+        else:
+            added.append(defect)
+
+    avail = collections.Counter(new_keys)
+    fixed = []
+    for (key, defect) in zip(old_keys, old):
+        if 0 < avail[key]:
+            avail[key] -= 1
+        else:
+            fixed.append(defect)
+    return (fixed, added, unchanged)
+
+
+def diff_results(results, old_file, new_file, fixed_file, added_file, unchanged_file,
+                 ignore_path=False):
+    """write fixed, added, and unchanged defects found by comparing two files"""
+    results.print_with_ts("diffing '%s' and '%s' in-process" % (old_file, new_file))
+    try:
+        old = load_defects(old_file)
+        new = load_defects(new_file)
+    except (IOError, OSError, ValueError) as e:
+        results.error("failed to read scan results: %s" % e, ec=0)
+        return 1
+
+    (fixed, added, unchanged) = diff_defects(
+        old.get("defects", []), new.get("defects", []), ignore_path)
+    for (src, defects, fname) in [
+            (old, fixed, fixed_file),
+            (new, added, added_file),
+            (new, unchanged, unchanged_file)]:
+        data = collections.OrderedDict(src)
+        data["defects"] = defects
+        dump_defects(data, fname)
+    results.print_with_ts("fixed: %d, added: %d, unchanged: %d"
+                          % (len(fixed), len(added), len(unchanged)))
+    return 0
+
+
+class KfpFilter:
+    """drop known false positives, equivalent to 'csdiff --show-internal KFP -'.
+    The list of known false positives is compiled into an indexed database in
+    cache_dir, which is rebuilt only when the source file changes."""
+    def __init__(self, source, cache_dir):
+        self.source = os.path.realpath(source)
+        key = hashlib.sha256(self.source.encode("utf8")).hexdigest()
+        self.db_file = "%s/kfp/%s.sqlite" % (cache_dir, key[:16])
+        self.db = None
+
+    # version of the database schema and of the fingerprints stored in it
+    DB_FORMAT = 3
+
+    def source_stamp(self):
+        st = os.stat(self.source)
+        return "%d:%d:%d" % (KfpFilter.DB_FORMAT, st.st_size, int(st.st_mtime * 1000))
+
+    def is_up2date(self):
+        if not os.path.exists(self.db_file):
+            return False
+        try:
+            db = sqlite3.connect(self.db_file)
+            row = db.execute("SELECT value FROM meta WHERE key = 'stamp'").fetchone()
+            db.close()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == self.source_stamp()
+
+    def compile(self, results):
+        # csgrep reads both the JSON format and the legacy text format
+        db_dir = os.path.dirname(self.db_file)
+        if not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        tmp_js = "%s.%d.js" % (self.db_file, os.getpid())
+        stamp = self.source_stamp()
+        if results.exec_cmd("csgrep --mode=json --quiet '%s' > '%s'"
+                            % (self.source, tmp_js), shell=True) != 0:
+            raise IOError("failed to read known false positives: %s" % self.source)
+        defects = load_defects(tmp_js).get("defects", [])
+        os.remove(tmp_js)
+
+        tmp_db = "%s.%d" % (self.db_file, os.getpid())
+        db = sqlite3.connect(tmp_db)
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE kfp (checker TEXT, event TEXT, path TEXT, msg TEXT, \
+PRIMARY KEY (checker, event, path, msg)) WITHOUT ROWID")
+        db.executemany("INSERT OR IGNORE INTO kfp VALUES (?, ?, ?, ?)",
+                       (defect_fingerprint(d) for d in defects))
+        db.execute("INSERT INTO meta VALUES ('source', ?)", (self.source,))
+        db.execute("INSERT INTO meta VALUES ('stamp', ?)", (stamp,))
+        db.commit()
+        db.close()
+        os.rename(tmp_db, self.db_file)
+        results.print_with_ts("compiled %d known false positives into '%s'"
+                              % (len(defects), self.db_file))
+
+    def prepare(self, results):
+        if not self.is_up2date():
+            self.compile(results)
+        self.db = sqlite3.connect(self.db_file)
+
+    def apply(self, defects):
+        query = "SELECT 1 FROM kfp WHERE checker = ? AND event = ? AND path = ? AND msg = ?"
+        for defect in defects:
+            if self.db.execute(query, defect_fingerprint(defect)).fetchone() is None:
+                yield defect
+
+    def finish(self, data):
+        self.db.close()
+        self.db = None
+
+    def to_shell(self):
+        return "csdiff --json-output --show-internal '%s' -" % self.source
+
+
+def parse_csgrep_args(args):
+    """translate predicates given as csgrep command-line arguments to keyword
+    arguments of DefectFilter, return None if they cannot be translated"""
+    kwargs = {}
+    try:
+        tokens = shlex.split(args)
+    except ValueError:
+        return None
+    while tokens:
+        tok = tokens.pop(0)
+        if tok in ["-v", "--invert-match"]:
+            kwargs["invert_match"] = True
+            continue
+        if tok in ["-r", "--invert-regex"]:
+            kwargs["invert_regex"] = True
+            continue
+
+        (opt, _, val) = tok.partition("=")
+        key = {"--checker": "checker", "--event": "event", "--msg": "msg",
+               "--path": "path"}.get(opt)
+        if key is None or key in kwargs:
+            # unknown or repeated option
+            return None
+        if not val:
+            if not tokens:
+                return None
+            val = tokens.pop(0)
+        try:
+            re.compile(val)
+        except re.error:
+            return None
+        kwargs[key] = val
+    return kwargs
+
+
+class ImpClassifier:
+    """set the "imp" flag on important defects and collect them for imp_file"""
+    def __init__(self, imp_re, drop_filters, imp_file):
+        self.imp_re = re.compile(imp_re)
+        self.drop_filters = drop_filters
+        self.imp_file = imp_file
+        self.imp_defects = []
+
+    def is_imp(self, defect):
+        if self.imp_re.search(defect.get("checker", "")) is None:
+            return False
+        for filt in self.drop_filters:
+            if filt.matches(defect):
+                return False
+        return True
+
+    def apply(self, defects):
+        for defect in defects:
+            if self.is_imp(defect):
+                defect["imp"] = 1
+                self.imp_defects.append(defect)
+            yield defect
+
+    def finish(self, data):
+        imp_data = collections.OrderedDict(data)
+        imp_data["defects"] = self.imp_defects
+        dump_defects(imp_data, self.imp_file)
+
+    def copy_scan_props(self, js_file):
+        """use the scan properties of js_file (e.g. added by cslinker --inifile
+        after the classification) in imp_file"""
+        scan = read_scan_props(js_file)
+        if scan is None:
+            return
+        data = load_defects(self.imp_file)
+        imp_data = collections.OrderedDict([("scan", scan)])
+        for (key, val) in data.items():
+            if key != "scan":
+                imp_data[key] = val
+        dump_defects(imp_data, self.imp_file)
+
+    def to_shell(self):
+        # equivalent of the pipeline used when the rules cannot be evaluated here
+        return "cslinker --implist '%s' -" % self.imp_file
+
+
+def is_filter_cmd(filt):
+    """return True if filt is a shell command rather than a declarative filter"""
+    return not hasattr(filt, "apply")
+
+
+def apply_filters(results, filters, in_file, out_file, final_cmd=None):
+    """apply the given list of filters on in_file and write the result to
+    out_file, optionally piped through final_cmd (e.g. cssort).  Each run of
+    consecutive declarative filters is evaluated in a single pass in-process,
+    shell commands are executed as a pipeline.  Returns exit code of the
+    last failing command, zero on success."""
+    if not filters and final_cmd is None:
+        final_cmd = "cat"
+
+    # split the filters into groups of the same kind
+    groups = []
+    for filt in filters:
+        if groups and is_filter_cmd(groups[-1][0]) == is_filter_cmd(filt):
+            groups[-1].append(filt)
+        else:
+            groups.append([filt])
+
+    ec = 0
+    cur_file = in_file
+    for (i, group) in enumerate(groups):
+        last = (i == len(groups) - 1) and final_cmd is None
+        dst_file = out_file if last else "%s.%d" % (out_file, i)
+        if is_filter_cmd(group[0]):
+            cmd = "cat '%s'" % cur_file
+            for filt in group:
+                cmd += " | %s" % filt
+            cmd += " > '%s'" % dst_file
+            rv = results.exec_cmd(cmd, shell=True)
+        else:
+            results.print_with_ts("%s < '%s' > '%s' (in-process)" % (
+                " | ".join(filt.to_shell() for filt in group), cur_file, dst_file))
+            rv = 0
+            try:
+                for filt in group:
+                    if hasattr(filt, "prepare"):
+                        filt.prepare(results)
+                data = load_defects(cur_file)
+                defects = data.get("defects", [])
+                for filt in group:
+                    defects = filt.apply(defects)
+                data["defects"] = list(defects)
+                dump_defects(data, dst_file)
+                for filt in group:
+                    if hasattr(filt, "finish"):
+                        # let the filter process the whole filtered list
+                        filt.finish(data)
+            except (IOError, OSError, ValueError, sqlite3.Error) as e:
+                results.error("failed to filter '%s': %s" % (cur_file, e), ec=0)
+                rv = 1
+
+        if rv != 0:
+            ec = rv
+        if cur_file != in_file:
+            os.remove(cur_file)
+        cur_file = dst_file
+
+    if final_cmd is not None:
+        rv = results.exec_cmd("%s < '%s' > '%s'" % (final_cmd, cur_file, out_file), shell=True)
+        if rv != 0:
+            ec = rv
+        if cur_file != in_file:
+            os.remove(cur_file)
+    return ec
@@ -0,0 +1,281 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# History of scans (timings, defect counts, hit rates of caches) stored in an
+# SQLite database shared by all scans on the host.  The latest scan of each
+# package is compared with its previous scans by the same mock profile and
+# analyzers to detect scans that took significantly longer (or needed more
+# packages) than usual.
+
+# standard imports
+import collections
+import os
+import re
+import sqlite3
+import statistics
+
+# local imports
+from csmock.common.defects      import iter_defects
+
+DEFAULT_HISTORY_DB = "/var/lib/csmock/history.sqlite"
+
+# number of previous scans a scan is compared with
+DEFAULT_WINDOW = 20
+
+# minimal number of previous scans needed to detect a regression
+MIN_SAMPLES = 5
+
+# robust z-score (based on median and MAD) above which a value is a regression
+DEFAULT_THRESHOLD = 3.5
+
+# minimal ratio of a value to the median to be reported as a regression
+DEFAULT_MIN_RATIO = 1.5
+
+# minimal absolute increase to be reported (to ignore noise of short phases)
+MIN_TIME_DELTA = 5.0
+MIN_COUNT_DELTA = 10
+
+# how long to wait for other scans writing to the database [s]
+DB_TIMEOUT = 60
+
+# keys of scan.ini recorded as metrics of the scan
+RECORDED_INI_KEYS_RE = re.compile("^(pkg-cache-(hits|misses)|(installed|required)-packages)$")
+
+# metrics checked for regressions (the higher the worse)
+CHECKED_METRICS_RE = re.compile("^(time-(wall|cpu)(-.*)?|(installed|required)-packages)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (id INTEGER PRIMARY KEY, time TEXT,
+    host TEXT, tool TEXT, tool_version TEXT, project TEXT, package TEXT,
+    profile TEXT, analyzers TEXT, exit_code INTEGER, wall REAL, cpu REAL);
+CREATE TABLE IF NOT EXISTS metrics (scan_id INTEGER REFERENCES scans(id),
+    name TEXT, value REAL, PRIMARY KEY (scan_id, name));
+CREATE INDEX IF NOT EXISTS scans_group ON scans (package, profile, analyzers);
+"""
+
+Regression = collections.namedtuple(
+    "Regression", "scan_id package profile analyzers metric value median z")
+
+
+def package_name(nvr):
+    """return name of the package given by NVR (or the input as it is)"""
+    if nvr is None:
+        return None
+    return re.sub("-[^-]+-[^-]+$", "", nvr)
+
+
+def open_db(db_file):
+    db_dir = os.path.dirname(db_file)
+    if db_dir and not os.path.isdir(db_dir):
+        os.makedirs(db_dir)
+    db = sqlite3.connect(db_file, timeout=DB_TIMEOUT)
+    db.executescript(SCHEMA)
+    return db
+
+
+def defect_counts(js_file):
+    """return numbers of defects in js_file by the tool that reported them"""
+    counts = collections.Counter()
+    for (kind, val) in iter_defects(js_file):
+        if kind == "defect":
+            counts[val.get("tool", "unknown")] += 1
+    return counts
+
+
+def record_scan(db_file, ini, phases, wall, cpu, ec, js_file=None):
+    """append a finished scan to the history, ini is a dictionary of values
+    written to scan.ini, phases a list of (key, wall, cpu) of its phases, and
+    js_file the list of defects (if any)"""
+    metrics = {}
+    for (key, val) in ini.items():
+        if RECORDED_INI_KEYS_RE.match(key):
+            metrics[key] = float(val)
+    for (key, phase_wall, phase_cpu) in phases:
+        metrics["time-wall-%s" % key] = phase_wall
+        metrics["time-cpu-%s" % key] = phase_cpu
+    if "chroot-cache" in ini:
+        metrics["chroot-cache-hit"] = 1 if ini["chroot-cache"] == "hit" else 0
+    if js_file is not None and os.path.exists(js_file):
+        counts = defect_counts(js_file)
+        metrics["defects"] = sum(counts.values())
+        for (tool, cnt) in counts.items():
+            metrics["defects-%s" % tool] = cnt
+
+    db = open_db(db_file)
+    try:
+        with db:
+            cur = db.execute(
+                "INSERT INTO scans VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    ini.get("time-created"), ini.get("host"), ini.get("tool"),
+                    ini.get("tool-version"), ini.get("project-name"),
+                    package_name(ini.get("project-name")), ini.get("mock-config"),
+                    ini.get("analyzers", ""), ec, wall, cpu))
+            metrics["time-wall"] = wall
+            metrics["time-cpu"] = cpu
+            db.executemany("INSERT INTO metrics VALUES (?, ?, ?)",
+                           [(cur.lastrowid, k, v) for (k, v) in sorted(metrics.items())])
+    finally:
+        db.close()
+
+
+def scan_metrics(db, scan_ids):
+    """return {scan_id: {metric: value}} for the given scans"""
+    result = collections.defaultdict(dict)
+    if not scan_ids:
+        return result
+    query = "SELECT scan_id, name, value FROM metrics WHERE scan_id IN (%s)" \
+            % ", ".join("?" * len(scan_ids))
+    for (scan_id, name, value) in db.execute(query, list(scan_ids)):
+        result[scan_id][name] = value
+    return result
+
+
+def latest_scans(db, package=None, profile=None):
+    """return (scan_id, package, profile, analyzers) of the latest scan of
+    each package by each mock profile and set of analyzers"""
+    query = "SELECT MAX(id), package, profile, analyzers FROM scans"
+    cond = []
+    params = []
+    if package is not None:
+        cond.append("package = ?")
+        params.append(package)
+    if profile is not None:
+        cond.append("profile = ?")
+        params.append(profile)
+    if cond:
+        query += " WHERE " + " AND ".join(cond)
+    query += " GROUP BY package, profile, analyzers ORDER BY package, profile, analyzers"
+    return db.execute(query, params).fetchall()
+
+
+def min_delta(metric):
+    return MIN_TIME_DELTA if metric.startswith("time-") else MIN_COUNT_DELTA
+
+
+def robust_z(value, samples, metric):
+    """return (median of samples, robust z-score of value with respect to them)"""
+    med = statistics.median(samples)
+    mad = statistics.median([abs(s - med) for s in samples])
+    # avoid division by zero if the previous scans took exactly the same time
+    scale = max(1.4826 * mad, 0.05 * med, 0.1 * min_delta(metric))
+    return (med, (value - med) / scale)
+
+
+def find_regressions(db, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD,
+                     min_ratio=DEFAULT_MIN_RATIO, package=None, profile=None):
+    """compare the latest scan of each package with its previous successful
+    scans, return the list of metrics that got significantly worse"""
+    result = []
+    for (scan_id, pkg, prof, analyzers) in latest_scans(db, package, profile):
+        prev_ids = [row[0] for row in db.execute(
+            "SELECT id FROM scans WHERE package IS ? AND profile IS ? AND analyzers IS ? \
+AND exit_code = 0 AND id < ? ORDER BY id DESC LIMIT ?",
+            (pkg, prof, analyzers, scan_id, window))]
+        if len(prev_ids) < MIN_SAMPLES:
+            continue
+
+        prev = scan_metrics(db, prev_ids)
+        for (metric, value) in sorted(scan_metrics(db, [scan_id])[scan_id].items()):
+            if not CHECKED_METRICS_RE.match(metric):
+                continue
+            samples = [prev[i][metric] for i in prev_ids if metric in prev[i]]
+            if len(samples) < MIN_SAMPLES:
+                continue
+            (med, z) = robust_z(value, samples, metric)
+            if z >= threshold and value >= min_ratio * med and value - med >= min_delta(metric):
+                result.append(Regression(scan_id, pkg, prof, analyzers, metric, value, med, z))
+    return result
+
+
+def prom_labels(**labels):
+    def escape(val):
+        val = "%s" % ("" if val is None else val)
+        return val.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    return "{%s}" % ",".join(
+        "%s=\"%s\"" % (key, escape(val)) for (key, val) in sorted(labels.items()))
+
+
+def write_prometheus(db, fname, regressions, window=DEFAULT_WINDOW,
+                     package=None, profile=None):
+    """write metrics of the latest scans to fname in the text format of
+    Prometheus (to be picked by the textfile collector of node_exporter)"""
+    families = collections.OrderedDict([
+        ("csmock_scan_duration_seconds", ("gauge", "Wall-clock time of the latest scan.")),
+        ("csmock_scan_cpu_seconds", ("gauge", "CPU time of the latest scan.")),
+        ("csmock_scan_exit_code", ("gauge", "Exit code of the latest scan.")),
+        ("csmock_phase_duration_seconds", ("gauge", "Wall-clock time of a phase of the latest scan.")),
+        ("csmock_defects", ("gauge", "Number of defects found by the latest scan.")),
+        ("csmock_installed_packages", ("gauge", "Number of packages installed in the chroot.")),
+        ("csmock_required_packages", ("gauge", "Number of BuildRequires of the scanned package.")),
+        ("csmock_regression", ("gauge", "Metric of the latest scan that got significantly worse.")),
+        ("csmock_chroot_cache_hit_ratio", ("gauge", "Hit rate of the chroot cache in recent scans.")),
+        ("csmock_pkg_cache_hit_ratio", ("gauge", "Hit rate of the package cache in recent scans.")),
+        ("csmock_scans_total", ("counter", "Number of scans recorded in the history."))])
+    samples = collections.defaultdict(list)
+
+    latest = latest_scans(db, package, profile)
+    metrics = scan_metrics(db, [row[0] for row in latest])
+    for (scan_id, pkg, prof, analyzers) in latest:
+        labels = {"package": pkg, "profile": prof, "analyzers": analyzers}
+        (ec, wall, cpu) = db.execute(
+            "SELECT exit_code, wall, cpu FROM scans WHERE id = ?", (scan_id,)).fetchone()
+        samples["csmock_scan_duration_seconds"].append((labels, wall))
+        samples["csmock_scan_cpu_seconds"].append((labels, cpu))
+        samples["csmock_scan_exit_code"].append((labels, ec))
+        for (metric, value) in sorted(metrics[scan_id].items()):
+            if metric.startswith("time-wall-"):
+                samples["csmock_phase_duration_seconds"].append(
+                    (dict(labels, phase=metric[len("time-wall-"):]), value))
+            elif metric.startswith("defects-"):
+                samples["csmock_defects"].append(
+                    (dict(labels, tool=metric[len("defects-"):]), value))
+            elif metric in ["installed-packages", "required-packages"]:
+                samples["csmock_%s" % metric.replace("-", "_")].append((labels, value))
+
+    for reg in regressions:
+        samples["csmock_regression"].append(({
+            "package": reg.package, "profile": reg.profile,
+            "analyzers": reg.analyzers, "metric": reg.metric}, 1))
+
+    # hit rates of the caches and numbers of scans per mock profile
+    for (prof, count) in db.execute("SELECT profile, COUNT(*) FROM scans GROUP BY profile"):
+        if profile is not None and prof != profile:
+            continue
+        labels = {"profile": prof}
+        samples["csmock_scans_total"].append((labels, count))
+        recent = [row[0] for row in db.execute(
+            "SELECT id FROM scans WHERE profile IS ? ORDER BY id DESC LIMIT ?", (prof, window))]
+        recent = scan_metrics(db, recent).values()
+        chroot = [m["chroot-cache-hit"] for m in recent if "chroot-cache-hit" in m]
+        if chroot:
+            samples["csmock_chroot_cache_hit_ratio"].append((labels, sum(chroot) / len(chroot)))
+        hits = sum(m.get("pkg-cache-hits", 0) for m in recent)
+        total = hits + sum(m.get("pkg-cache-misses", 0) for m in recent)
+        if total:
+            samples["csmock_pkg_cache_hit_ratio"].append((labels, hits / total))
+
+    # the file needs to be replaced atomically for the textfile collector
+    tmp_file = "%s.tmp" % fname
+    with open(tmp_file, "w") as f:
+        for (name, (kind, desc)) in families.items():
+            if not samples[name]:
+                continue
+            f.write("# HELP %s %s\n# TYPE %s %s\n" % (name, desc, name, kind))
+            for (labels, value) in samples[name]:
+                f.write("%s%s %s\n" % (name, prom_labels(**labels), value))
+    os.rename(tmp_file, fname)
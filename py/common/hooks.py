@@ -0,0 +1,113 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# Scheduling of post-build commands and post-process hooks.  Plug-ins declare
+# inputs and outputs of their hooks by wrapping them in Hook, which lets csmock
+# start each hook as soon as the hooks it depends on have finished.
+
+# standard imports
+import re
+
+
+class Hook:
+    """command or function with declared inputs and outputs (paths, or any
+    other names of the data that it reads and writes)"""
+    def __init__(self, action, inputs=(), outputs=()):
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+def hook_action(hook):
+    """return the command or function of a hook (declared by Hook or not)"""
+    return hook.action if isinstance(hook, Hook) else hook
+
+
+def paths_overlap(a, b):
+    """return True if a and b are the same path or one of them contains the other"""
+    a = a.rstrip("/")
+    b = b.rstrip("/")
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def any_overlap(paths_a, paths_b):
+    return any(paths_overlap(a, b) for a in paths_a for b in paths_b)
+
+
+def depends_on(hook, prev):
+    """return True if hook needs to run after prev"""
+    if not isinstance(hook, Hook) or not isinstance(prev, Hook):
+        # hooks without declared inputs and outputs run alone
+        return True
+    return any_overlap(prev.outputs, hook.inputs + hook.outputs) \
+        or any_overlap(hook.outputs, prev.inputs)
+
+
+def hook_deps(hooks):
+    """return the list of sets of indices of the preceding hooks that each of
+    the hooks needs to run after"""
+    return [set(j for j in range(i) if depends_on(hook, hooks[j]))
+            for (i, hook) in enumerate(hooks)]
+
+
+def parallel_shell_cmd(cmds, deps, max_jobs, times_file):
+    """return a shell command that runs each of cmds once the commands given by
+    its deps (indices) have finished, at most max_jobs of them in parallel, and
+    fails if any of them fails; start and end of each command are written into
+    times_file (see read_cmd_times())"""
+    # the finished commands leave their records in $jobs_dir, a FIFO holds
+    # a token for each free job slot (the way the jobserver of make does)
+    script = "jobs_dir=$(mktemp -d) && mkfifo $jobs_dir/slots \
+&& exec 3<>$jobs_dir/slots && printf '%s' >&3 || exit $?; " % ("x" * max_jobs)
+    for (i, cmd) in enumerate(cmds):
+        script += "( "
+        for j in sorted(deps[i]):
+            script += "while test ! -e $jobs_dir/%d; do sleep 1; done; " % j
+        script += "dd bs=1 count=1 <&3 >/dev/null 2>&1; start=$(date +%s.%N); "
+        script += "( %s ) 3>&-; ec=$?; end=$(date +%%s.%%N); printf x >&3; " % cmd
+        # the second line printed by 'times' is CPU time of the children
+        script += "times > $jobs_dir/%d.cpu; { read u s; read u s; } < $jobs_dir/%d.cpu; " % (i, i)
+        script += "echo %d $ec $start $end $u $s > $jobs_dir/%d.tmp; " % (i, i)
+        script += "mv $jobs_dir/%d.tmp $jobs_dir/%d ) & " % (i, i)
+    script += "wait; ec=0; : > %s; " % times_file
+    script += "for i in %s; do " % " ".join(str(i) for i in range(len(cmds)))
+    script += "read i rv rest < $jobs_dir/$i; test \"$rv\" = 0 || ec=$rv; "
+    script += "cat $jobs_dir/$i >> %s; done; " % times_file
+    return script + "rm -rf $jobs_dir; exit $ec"
+
+
+def parse_cpu_time(s):
+    """parse CPU time printed by the 'times' shell builtin (e.g. 1m2.345s)"""
+    m = re.match("^([0-9]+)m([0-9.]+)s$", s)
+    if m is None:
+        raise ValueError("unrecognized CPU time: %s" % s)
+    return 60 * int(m.group(1)) + float(m.group(2))
+
+
+def read_cmd_times(data):
+    """parse the content of times_file written by the command returned from
+    parallel_shell_cmd(), return {index: (start, end, cpu)}"""
+    times = {}
+    for line in data.splitlines():
+        try:
+            (i, _, start, end, user, system) = line.split()
+            times[int(i)] = (float(start), float(end),
+                             parse_cpu_time(user) + parse_cpu_time(system))
+        except ValueError:
+            # a command that could not be measured (e.g. date not available)
+            continue
+    return times
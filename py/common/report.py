@@ -0,0 +1,251 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+# standard imports
+import io
+import json
+import os
+import shutil
+
+# local imports
+from csmock.common.defects      import iter_defects
+from csmock.common.defects      import key_event
+
+# number of defects stored in a single data file of the paged report
+DEFAULT_CHUNK_SIZE = 500
+
+# data files are loaded by <script> elements because browsers do not allow
+# XMLHttpRequest on file:// URLs
+CHUNK_TPL = u"csmockReport.addChunk(%d, %s);\n"
+INDEX_TPL = u"csmockReport.setIndex(%s);\n"
+
+HTML_TPL = u"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<style>
+body { font-family: sans-serif; }
+#filters select, #filters input { margin-right: 1em; }
+.defect { margin: 1em 0; }
+.checker { font-weight: bold; }
+.events { font-family: monospace; white-space: pre-wrap; margin: 0; }
+.key { font-weight: bold; }
+.imp { color: #c00; }
+</style>
+</head>
+<body>
+<h1 id="title">%(title)s</h1>
+<div id="filters">
+checker: <select id="checker"><option value="">(all)</option></select>
+file: <select id="file"><option value="">(all)</option></select>
+text: <input id="text" type="text">
+<button id="prev">&lt;</button> <span id="status"></span> <button id="next">&gt;</button>
+</div>
+<div id="defects"></div>
+<script>
+var csmockReport = (function() {
+    var dataDir = %(data_dir)s;
+    var index = null;
+    var chunks = {};
+    var waiting = {};
+    var page = 0;
+    var pageChunks = [];
+
+    function $(id) { return document.getElementById(id); }
+
+    function loadChunk(n, done) {
+        if (n in chunks) { done(); return; }
+        if (n in waiting) { waiting[n].push(done); return; }
+        waiting[n] = [done];
+        var s = document.createElement("script");
+        s.src = dataDir + "/chunk-" + n + ".js";
+        document.head.appendChild(s);
+    }
+
+    function selectedChunks() {
+        var sets = [];
+        var chk = $("checker").value;
+        var file = $("file").value;
+        if (chk) sets.push(index.checkers[chk]);
+        if (file) sets.push(index.files[file]);
+        var all = [];
+        for (var i = 0; i < index.chunks; i++) all.push(i);
+        return sets.reduce(function(acc, s) {
+            return acc.filter(function(n) { return s.indexOf(n) >= 0; });
+        }, all);
+    }
+
+    function matches(d) {
+        var chk = $("checker").value;
+        var file = $("file").value;
+        var text = $("text").value;
+        var key = d.events[d.key_event_idx || 0] || {};
+        if (chk && d.checker != chk) return false;
+        if (file && key.file_name != file) return false;
+        return !text || JSON.stringify(d).indexOf(text) >= 0;
+    }
+
+    function renderEvent(e, isKey) {
+        var line = document.createElement("div");
+        if (isKey) line.className = "key";
+        var loc = e.file_name || "";
+        if (e.line) loc += ":" + e.line;
+        if (e.column) loc += ":" + e.column;
+        line.textContent = loc + ": " + e.event + ": " + e.message;
+        return line;
+    }
+
+    function render() {
+        var box = $("defects");
+        box.innerHTML = "";
+        var n = pageChunks[page];
+        $("status").textContent = pageChunks.length
+            ? "data file " + (page + 1) + " of " + pageChunks.length
+                + " (" + index.total + " defects in total)"
+            : "no matching defects";
+        if (n === undefined) return;
+        chunks[n].filter(matches).forEach(function(d) {
+            var div = document.createElement("div");
+            div.className = "defect";
+            var hdr = document.createElement("div");
+            hdr.className = "checker" + (d.imp ? " imp" : "");
+            hdr.textContent = "Error: " + d.checker + (d.cwe ? " (CWE-" + d.cwe + ")" : "") + ":";
+            div.appendChild(hdr);
+            var evts = document.createElement("div");
+            evts.className = "events";
+            d.events.forEach(function(e, i) {
+                evts.appendChild(renderEvent(e, i == (d.key_event_idx || 0)));
+            });
+            div.appendChild(evts);
+            box.appendChild(div);
+        });
+    }
+
+    function show(p) {
+        page = Math.max(0, Math.min(p, pageChunks.length - 1));
+        var n = pageChunks[page];
+        if (n === undefined) { render(); return; }
+        loadChunk(n, render);
+    }
+
+    function update() {
+        pageChunks = selectedChunks();
+        show(0);
+    }
+
+    function fillSelect(sel, keys) {
+        keys.sort().forEach(function(k) {
+            var opt = document.createElement("option");
+            opt.value = k;
+            opt.textContent = k;
+            sel.appendChild(opt);
+        });
+    }
+
+    return {
+        setIndex: function(idx) {
+            index = idx;
+            fillSelect($("checker"), Object.keys(idx.checkers));
+            fillSelect($("file"), Object.keys(idx.files));
+            $("checker").onchange = update;
+            $("file").onchange = update;
+            $("text").onchange = render;
+            $("prev").onclick = function() { show(page - 1); };
+            $("next").onclick = function() { show(page + 1); };
+            update();
+        },
+        addChunk: function(n, defects) {
+            chunks[n] = defects;
+            (waiting[n] || []).forEach(function(done) { done(); });
+            delete waiting[n];
+        }
+    };
+})();
+</script>
+<script src="%(data_dir_attr)s/index.js"></script>
+</body>
+</html>
+"""
+
+
+def html_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") \
+            .replace("\"", "&quot;")
+
+
+def write_paged_html(js_file, html_file, chunk_size=DEFAULT_CHUNK_SIZE, items=None):
+    """write a small HTML page that loads the list of defects from js_file
+    on demand from data files split into chunks of chunk_size defects; items
+    (if given) are the ("scan", SCAN) and ("defect", DEFECT) pairs of js_file
+    already read (see iter_defects())"""
+    data_dir = html_file[:-len(".html")] + "-html" if html_file.endswith(".html") \
+            else html_file + "-data"
+    if os.path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.mkdir(data_dir)
+
+    scan = {}
+    checkers = {}
+    files = {}
+    total = 0
+    chunk = []
+
+    def flush_chunk():
+        n = (total - 1) // chunk_size
+        with io.open("%s/chunk-%d.js" % (data_dir, n), "w", encoding="utf8") as f:
+            f.write(CHUNK_TPL % (n, json.dumps(chunk, ensure_ascii=False,
+                                               separators=(",", ":"))))
+
+    if items is None:
+        items = iter_defects(js_file)
+    for (kind, val) in items:
+        if kind == "scan":
+            scan = val
+            continue
+
+        n = total // chunk_size
+        for (idx, key) in [(checkers, val.get("checker")),
+                           (files, key_event(val).get("file_name"))]:
+            lst = idx.setdefault(key or "", [])
+            if not lst or lst[-1] != n:
+                lst.append(n)
+        chunk.append(val)
+        total += 1
+        if len(chunk) == chunk_size:
+            flush_chunk()
+            chunk = []
+    if chunk:
+        flush_chunk()
+
+    index = {
+        "scan": scan,
+        "total": total,
+        "chunks": (total + chunk_size - 1) // chunk_size,
+        "checkers": checkers,
+        "files": files}
+    with io.open("%s/index.js" % data_dir, "w", encoding="utf8") as f:
+        f.write(INDEX_TPL % json.dumps(index, ensure_ascii=False, separators=(",", ":")))
+
+    title = scan.get("title", os.path.basename(js_file))
+    rel_dir = os.path.basename(data_dir)
+    with io.open(html_file, "w", encoding="utf8") as f:
+        f.write(HTML_TPL % {
+            "title": html_escape(title),
+            "data_dir": json.dumps(rel_dir),
+            "data_dir_attr": html_escape(rel_dir)})
+    return data_dir
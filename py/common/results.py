@@ -17,24 +17,171 @@
 
 # standard imports
 import codecs
+import contextlib
 import datetime
 import errno
+import fcntl
+import json
 import os
+import queue
 import re
+import shlex
 import shutil
 import signal
 import socket
+import sqlite3
 import stat
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 
 # local imports
+from csmock.common.archive      import BlockWriter
+from csmock.common.archive      import write_archive
+from csmock.common.defects      import DefectFilter
+from csmock.common.defects      import dump_defects
+from csmock.common.defects      import event_stats
+from csmock.common.defects      import load_defects
+from csmock.common.defects      import prune_events
+from csmock.common.defects      import write_err
+from csmock.common.defects      import write_ndjson
+from csmock.common.history      import record_scan
+from csmock.common.report       import write_paged_html
 from csmock.common.util         import shell_quote
 from csmock.common.util         import strlist_to_shell_cmd
 
-CSGREP_FINAL_FILTER_ARGS = "--invert-match --event \"internal warning\" \
---prune-events=1"
+# the final filter, equivalent to 'csgrep --invert-match --event "internal
+# warning" --prune-events=1'
+FINAL_FILTER = DefectFilter(event="internal warning", invert_match=True)
+FINAL_PRUNE_EVENTS = 1
+
+# capacity of the pipe to the log writer (to make writers block less often)
+LOG_PIPE_SIZE = 1 << 20
+
+# size of uncompressed data compressed as a single block of scan.log
+LOG_BLOCK_SIZE = 4 << 20
+
+# how often exec_cmds() checks whether the commands have finished [s]
+EXEC_CMDS_POLL_INTERVAL = 0.01
+
+# lines of scan.log recorded in its index (by their prefix)
+LOG_INDEX_RE = re.compile(b"(?:^|\n)((?:>>>|!!!|<<<) [^\n]{0,256})")
+
+def cpu_time():
+    """return CPU time consumed by this process and its (waited for) children"""
+    t = os.times()
+    return t[0] + t[1] + t[2] + t[3]
+
+
+def profile_key(name):
+    """return name of a phase usable as a key in scan.ini"""
+    return re.sub("[^a-zA-Z0-9]+", "-", name).strip("-").lower()
+
+
+def phase_times(profile):
+    """return [(key, wall, cpu)] of the finished phases, with unique keys"""
+    result = []
+    keys = set()
+    for entry in profile:
+        if "wall" not in entry:
+            continue
+        key = profile_key(entry["name"])
+        n = 1
+        while key in keys:
+            n += 1
+            key = "%s-%d" % (profile_key(entry["name"]), n)
+        keys.add(key)
+        result.append((key, entry["wall"], entry["cpu"]))
+    return result
+
+
+def wait_child(pid, options=0):
+    """wait for a child process, return (exit code the way Popen.wait() returns
+    it, resource usage of the child), or None if WNOHANG is given and the child
+    is still running"""
+    (wpid, status, rusage) = os.wait4(pid, options)
+    if wpid == 0:
+        return None
+    if os.WIFSIGNALED(status):
+        return (-os.WTERMSIG(status), rusage)
+    return (os.WEXITSTATUS(status), rusage)
+
+
+def trace_name(cmd, shell):
+    """return a short name of the command for the trace viewer"""
+    try:
+        argv = shlex.split(cmd) if shell else cmd
+    except ValueError:
+        argv = cmd.split()
+    if not argv:
+        return "sh"
+    name = os.path.basename(argv[0])
+    for arg in argv[1:]:
+        # mock actions are long options without a value (--init, --chroot, ...)
+        if arg.startswith("--") and "=" not in arg:
+            return "%s %s" % (name, arg)
+    return name
+
+
+# lanes of the trace viewer (thread IDs in the trace), parallel commands
+# executed by exec_cmds() use TRACE_TID_PARALLEL + their index, compressors
+# of scan.log and the archive use TRACE_TID_COMPRESS + their slot, threads
+# of call_parallel() use TRACE_TID_THREAD + their slot
+TRACE_TID_MAIN = 0
+TRACE_TID_PARALLEL = 1
+TRACE_TID_SESSION = 1000
+TRACE_TID_COMPRESS = 2000
+TRACE_TID_THREAD = 3000
+
+
+class Tracer:
+    """events (commands and phases) in the Chrome trace event format"""
+    def __init__(self):
+        self.t0 = time.time()
+        self.pid = os.getpid()
+        self.events = []
+        self.tids = set()
+
+    def now(self):
+        """return time since the start of tracing [us]"""
+        return int((time.time() - self.t0) * 1000000)
+
+    def add(self, name, cat, start, args, tid=TRACE_TID_MAIN, end=None):
+        self.tids.add(tid)
+        if end is None:
+            end = self.now()
+        self.events.append({
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": start,
+            "dur": end - start,
+            "pid": self.pid,
+            "tid": tid,
+            "args": args})
+
+    def write(self, fname):
+        # name the lanes in the trace viewer
+        events = []
+        for tid in sorted(self.tids):
+            if tid == TRACE_TID_MAIN:
+                name = "csmock"
+            elif tid == TRACE_TID_SESSION:
+                name = "chroot session"
+            elif tid >= TRACE_TID_THREAD:
+                name = "thread %d" % (tid - TRACE_TID_THREAD)
+            elif tid >= TRACE_TID_COMPRESS:
+                name = "compressor %d" % (tid - TRACE_TID_COMPRESS)
+            else:
+                name = "parallel command %d" % (tid - TRACE_TID_PARALLEL)
+            events.append({"name": "thread_name", "ph": "M", "pid": self.pid,
+                           "tid": tid, "args": {"name": name}})
+
+        with open(fname, "w") as f:
+            json.dump({"traceEvents": events + self.events, "displayTimeUnit": "ms"}, f)
+
 
 def current_iso_date():
     now = datetime.datetime.now()
@@ -47,15 +194,100 @@ class FatalError(Exception):
         self.ec = ec
 
 
+class LogWriter:
+    """thread that copies data written to the log pipe to stdout and to the
+    log file (optionally compressed in blocks by codec), and records offsets
+    of the lines printed by print_with_ts() into an index written next to it"""
+    def __init__(self, log_file, codec=None, trace=None):
+        self.log_file = log_file
+        self.codec = codec
+        self.trace = trace
+        self.index = []
+        self.blocks = None
+        self.error = None
+        (self.rfd, wfd) = os.pipe()
+        try:
+            # F_SETPIPE_SZ is not exported by fcntl before Python 3.10
+            fcntl.fcntl(wfd, getattr(fcntl, "F_SETPIPE_SZ", 1031), LOG_PIPE_SIZE)
+        except (IOError, OSError):
+            pass
+        self.fd = os.fdopen(wfd, "wb")
+        self.stdout = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def update_index(self, data, offset, at_bol):
+        for m in LOG_INDEX_RE.finditer(data):
+            start = m.start(1)
+            if start == 0 and not at_bol:
+                continue
+            line = m.group(1).decode("utf8", "replace")
+            (ts, _, msg) = line[4:].partition("\t")
+            self.index.append([offset + start, line[:3], ts, msg])
+
+    def run(self):
+        try:
+            with open(self.log_file, "wb") as f:
+                writer = f
+                if self.codec is not None:
+                    writer = BlockWriter(f, self.codec, os.cpu_count() or 1, LOG_BLOCK_SIZE,
+                                         self.trace)
+                offset = 0
+                at_bol = True
+                while True:
+                    data = os.read(self.rfd, LOG_PIPE_SIZE)
+                    if not data:
+                        break
+                    self.stdout.write(data)
+                    self.stdout.flush()
+                    self.update_index(data, offset, at_bol)
+                    writer.write(data)
+                    offset += len(data)
+                    at_bol = data.endswith(b"\n")
+                if self.codec is not None:
+                    writer.close()
+                    self.blocks = writer.blocks
+        except (IOError, OSError) as e:
+            self.error = e
+            # keep draining the pipe so that writers do not block forever
+            while os.read(self.rfd, LOG_PIPE_SIZE):
+                pass
+        finally:
+            os.close(self.rfd)
+            self.stdout.close()
+
+    def close(self):
+        """close the pipe, wait for the data to be written, write the index"""
+        self.fd.close()
+        self.thread.join()
+        if self.error is not None:
+            sys.stderr.write("error: failed to write %s: %s\n" % (self.log_file, self.error))
+            return
+        with open("%s.idx" % self.log_file, "w") as f:
+            json.dump({
+                "format": 1,
+                "codec": self.codec,
+                "blocks": self.blocks,
+                "lines": self.index}, f, separators=(",", ":"))
+
+
 class ScanResults:
-    def __init__(self, output, tool, tool_version, keep_going=False, create_dbgdir=True):
+    def __init__(self, output, tool, tool_version, keep_going=False, create_dbgdir=True,
+                 log_codec=None, trace=False, history_db=None):
         self.output = output
+        self.history_db = history_db
+        self.log_codec = log_codec
+        self.tracer = Tracer() if trace else None
         self.tool = tool
         self.tool_version = tool_version
         self.keep_going = keep_going
         self.create_dbgdir = create_dbgdir
         self.use_xz = False
+        self.use_zstd = False
         self.use_tar = False
+        self.use_ndjson = False
+        self.use_paged_html = False
         self.dirname = os.path.basename(output)
         self.codec = codecs.lookup('utf8')
         self.ec = 0
@@ -67,16 +299,38 @@ class ScanResults:
         self.dbgdir = None
         self.dbgdir_raw = None
         self.dbgdir_uni = None
-        self.log_pid = None
+        self.log_writer = None
         self.log_fd = None
         self.ini_writer = None
         self.subproc = None
+        self.subprocs = []
+        self.child_pids = []
+
+        # child processes being waited for by threads of call_parallel(),
+        # lanes in the trace used by the threads, names of their running
+        # phases, and CPU time of the children they waited for (by their
+        # identifiers)
+        self.thread_subprocs = {}
+        self.thread_tids = {}
+        self.thread_phases = {}
+        self.thread_child_cpu = {}
+
+        # list of phases measured by phase() and names of the running ones
+        self.profile = []
+        self.phase_stack = []
+        self.time_start = time.time()
+        self.cpu_start = cpu_time()
 
         m = re.match("^(.*)\\.xz$", self.dirname)
         if m is not None:
             self.use_xz = True
             self.dirname = m.group(1)
 
+        m = re.match("^(.*)\\.zst$", self.dirname)
+        if m is not None:
+            self.use_zstd = True
+            self.dirname = m.group(1)
+
         m = re.match("^(.*)\\.tar$", self.dirname)
         if m is not None:
             self.use_tar = True
@@ -112,10 +366,11 @@ class ScanResults:
             os.mkdir(self.dbgdir_uni)
             os.mknod(os.path.join(self.dbgdir_uni, "empty.err"), stat.S_IFREG|0o444)
 
-        tee = ["tee", "%s/scan.log" % self.resdir]
-        self.log_pid = subprocess.Popen(
-            tee, stdin=subprocess.PIPE, preexec_fn=os.setsid)
-        self.log_fd = self.utf8_wrap(self.log_pid.stdin)
+        log_file = "%s/scan.log" % self.resdir
+        if self.log_codec is not None:
+            log_file += ".zst" if self.log_codec == "zstd" else ".xz"
+        self.log_writer = LogWriter(log_file, self.log_codec, self.compressor_trace())
+        self.log_fd = self.utf8_wrap(self.log_writer.fd)
 
         def signal_handler(signum, frame):
             # avoid throwing FatalError out of a signal handler
@@ -127,6 +382,14 @@ class ScanResults:
                     os.kill(self.subproc.pid, signum)
                 except Exception as e:
                     self.error("failed to kill child process: %s" % e)
+            procs = self.subprocs + list(self.thread_subprocs.values())
+            for pid in [p.pid for p in procs] + self.child_pids:
+                # forward the signal to commands running in parallel and to
+                # scans running in separate processes
+                try:
+                    os.kill(pid, signum)
+                except Exception as e:
+                    self.error("failed to kill child process: %s" % e)
             # this will make the foreground process throw FatalError synchronously
             self.dying = False
 
@@ -138,16 +401,31 @@ class ScanResults:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.ini_writer.close()
+        self.write_profile()
+        if self.history_db is not None:
+            self.record_history()
         self.print_with_ts("%s exit code: %d\n" % (self.tool, self.ec), prefix="<<< ")
-        self.log_fd.close()
+        self.log_fd.flush()
         self.log_fd = sys.stderr
-        self.log_pid.wait()
-        if self.use_tar:
-            tar_opts = "-c"
-            if self.use_xz:
-                tar_opts += "J"
-            tar_cmd = "tar %s -f '%s' -C '%s' '%s'" % (
-                tar_opts, self.output, self.tmpdir, self.dirname)
+        self.log_writer.close()
+        compress = self.use_tar and (self.use_xz or self.use_zstd)
+        if not compress:
+            self.write_trace()
+        if compress:
+            # compress blocks of the archive in parallel, the trace is written
+            # once the other members are compressed to cover their compressors
+            codec = "zstd" if self.use_zstd else "xz"
+            try:
+                write_archive(self.output, self.tmpdir, self.dirname, codec,
+                              trace=self.compressor_trace(), last=self.write_trace)
+            except (IOError, OSError) as e:
+                sys.stderr.write("%s: %s\n" % (self.tool, e))
+                self.fatal_error(
+                    "failed to write '%s', not removing '%s'..." % (
+                        self.output, self.tmpdir))
+        elif self.use_tar:
+            tar_cmd = "tar -c -f '%s' -C '%s' '%s'" % (
+                self.output, self.tmpdir, self.dirname)
             # do not treat 'tar: file changed as we read it' as fatal error
             if os.system(tar_cmd) > 1:
                 self.fatal_error(
@@ -162,6 +440,211 @@ class ScanResults:
                     % (self.tool, self.tmpdir))
 
 
+    def current_phases(self):
+        """return the names of the running phases of the current thread"""
+        return self.thread_phases.get(threading.get_ident(), self.phase_stack)
+
+    def cpu_time(self):
+        """return CPU time consumed by this process and its children, or only
+        by the current thread and its children in threads of call_parallel()"""
+        ident = threading.get_ident()
+        if ident not in self.thread_child_cpu:
+            return cpu_time()
+        return time.thread_time() + self.thread_child_cpu[ident]
+
+    @contextlib.contextmanager
+    def phase(self, name, cmd=None):
+        """measure wall-clock and CPU time spent in the with-block"""
+        stack = self.current_phases()
+        entry = {
+            "name": name,
+            "depth": len(stack),
+            "start": round(time.time() - self.time_start, 3)}
+        if cmd is not None:
+            entry["cmd"] = cmd
+        self.profile.append(entry)
+        stack.append(name)
+        trace_start = self.tracer.now() if self.tracer else None
+        t0 = time.time()
+        c0 = self.cpu_time()
+        try:
+            yield
+        finally:
+            stack.pop()
+            entry["wall"] = round(time.time() - t0, 3)
+            entry["cpu"] = round(self.cpu_time() - c0, 3)
+            if self.tracer is not None:
+                self.tracer.add(name, "phase", trace_start, {"cpu": entry["cpu"]},
+                                self.trace_tid())
+
+    def add_phase(self, name, start, end, cpu, cmd=None, tid=TRACE_TID_MAIN):
+        """record a phase measured elsewhere (start and end are UNIX time)"""
+        entry = {
+            "name": name,
+            "depth": len(self.current_phases()),
+            "start": round(start - self.time_start, 3)}
+        if cmd is not None:
+            entry["cmd"] = cmd
+        entry["wall"] = round(end - start, 3)
+        entry["cpu"] = round(cpu, 3)
+        self.profile.append(entry)
+        if self.tracer is not None:
+            to_us = lambda t: int((t - self.tracer.t0) * 1000000)
+            self.tracer.add(name, "phase", to_us(start), {"cpu": entry["cpu"]}, tid,
+                            to_us(end))
+
+    def write_profile(self):
+        if self.resdir is None:
+            return
+        fname = "%s/profile.json" % (self.dbgdir or self.resdir)
+        profile = {
+            "wall": round(time.time() - self.time_start, 3),
+            "cpu": round(cpu_time() - self.cpu_start, 3),
+            "phases": self.profile}
+        try:
+            with open(fname, "w") as f:
+                json.dump(profile, f, indent=1)
+        except (IOError, OSError) as e:
+            sys.stderr.write("%s: failed to write %s: %s\n" % (self.tool, fname, e))
+
+    def record_history(self):
+        """append the finished scan to the history database"""
+        js_file = "%s/scan-results.js" % self.resdir
+        try:
+            record_scan(self.history_db, self.ini_writer.values, phase_times(self.profile),
+                        round(time.time() - self.time_start, 3),
+                        round(cpu_time() - self.cpu_start, 3), self.ec, js_file)
+        except (sqlite3.Error, IOError, OSError, ValueError) as e:
+            sys.stderr.write("%s: failed to record the scan in %s: %s\n" % (
+                self.tool, self.history_db, e))
+
+    def write_trace(self):
+        """write the trace (if enabled), return the list of written files"""
+        if self.tracer is None:
+            return []
+        fname = "%s/trace.json" % (self.dbgdir or self.resdir)
+        try:
+            self.tracer.write(fname)
+        except (IOError, OSError) as e:
+            sys.stderr.write("%s: failed to write %s: %s\n" % (self.tool, fname, e))
+            return []
+        return [fname]
+
+    def trace_start(self):
+        return self.tracer.now() if self.tracer else None
+
+    def compressor_trace(self):
+        """return the trace callback of compressors (see run_filter()), or None
+        if tracing is disabled"""
+        if self.tracer is None:
+            return None
+
+        def trace(cmd, lane):
+            start = self.trace_start()
+            return lambda rv: self.trace_cmd(cmd, False, start, rv,
+                                             tid=TRACE_TID_COMPRESS + lane, cat="compress")
+        return trace
+
+    def trace_cmd(self, cmd, shell, start, rv, rusage=None, tid=TRACE_TID_MAIN, cat="cmd"):
+        """record an executed command if tracing is enabled"""
+        if self.tracer is None:
+            return
+        args = {
+            "cmd": cmd if shell else strlist_to_shell_cmd(cmd),
+            "exit_code": rv,
+            "phase": "/".join(self.current_phases())}
+        if rusage is not None:
+            args["cpu_user"] = round(rusage.ru_utime, 3)
+            args["cpu_sys"] = round(rusage.ru_stime, 3)
+        self.tracer.add(trace_name(cmd, shell), cat, start, args, tid)
+
+    def wait_subproc(self, proc, cmd, shell, start, tid=TRACE_TID_MAIN):
+        """wait for proc (running cmd), record it in trace, return its exit code"""
+        (rv, rusage) = wait_child(proc.pid)
+        proc.returncode = rv
+        self.account_child(rusage)
+        self.trace_cmd(cmd, shell, start, rv, rusage, tid)
+        return rv
+
+    def account_child(self, rusage):
+        """add CPU time of a child waited for by a thread of call_parallel()
+        to the CPU time of the thread"""
+        ident = threading.get_ident()
+        if ident in self.thread_child_cpu:
+            self.thread_child_cpu[ident] += rusage.ru_utime + rusage.ru_stime
+
+    def set_subproc(self, proc):
+        """remember the child process being waited for by the current thread
+        (to forward terminating signals to it)"""
+        if threading.current_thread() is threading.main_thread():
+            self.subproc = proc
+        elif proc is None:
+            del self.thread_subprocs[threading.get_ident()]
+        else:
+            self.thread_subprocs[threading.get_ident()] = proc
+
+    def trace_tid(self):
+        """return the lane in the trace for commands of the current thread"""
+        return self.thread_tids.get(threading.get_ident(), TRACE_TID_MAIN)
+
+    def call_parallel(self, funcs, names, deps=None, max_jobs=None):
+        """call each of the given functions with this object as the argument,
+        each in its own thread (measured as a phase of the given name) once
+        the functions given by its deps (indices) have returned, at most
+        max_jobs of them at a time, and return the list of their return values"""
+        if len(funcs) == 1:
+            with self.phase(names[0]):
+                return [funcs[0](self)]
+        if deps is None:
+            deps = [set()] * len(funcs)
+        if max_jobs is None:
+            max_jobs = len(funcs)
+
+        rvs = [None] * len(funcs)
+        errors = []
+        finished = queue.Queue()
+        phase_stack = list(self.phase_stack)
+
+        def run(i, slot):
+            ident = threading.get_ident()
+            self.thread_tids[ident] = TRACE_TID_THREAD + slot
+            self.thread_phases[ident] = list(phase_stack)
+            self.thread_child_cpu[ident] = 0.0
+            try:
+                with self.phase(names[i]):
+                    rvs[i] = funcs[i](self)
+            except BaseException as e:
+                # re-raised in the main thread (e.g. FatalError)
+                errors.append(e)
+            finally:
+                del self.thread_tids[ident]
+                del self.thread_phases[ident]
+                del self.thread_child_cpu[ident]
+                finished.put((i, slot))
+
+        waiting = list(range(len(funcs)))
+        done = set()
+        free_slots = list(range(max_jobs))
+        threads = {}
+        while waiting or threads:
+            # start the functions whose dependencies have returned
+            for i in list(waiting):
+                if not free_slots or errors:
+                    break
+                if deps[i] <= done:
+                    waiting.remove(i)
+                    threads[i] = threading.Thread(target=run, args=(i, free_slots.pop(0)))
+                    threads[i].start()
+            if not threads:
+                break
+            (i, slot) = finished.get()
+            threads.pop(i).join()
+            done.add(i)
+            free_slots.append(slot)
+        if errors:
+            raise errors[0]
+        return rvs
+
     def print_with_ts(self, msg, prefix=">>> "):
         self.log_fd.write("%s%s\t%s\n" % (prefix, current_iso_date(), msg))
         self.log_fd.flush()
@@ -202,11 +685,13 @@ class ScanResults:
                 self.print_with_ts(shell_quote(cmd))
             else:
                 self.print_with_ts(strlist_to_shell_cmd(cmd, escape_special=True))
+        start = self.trace_start()
         try:
-            self.subproc = subprocess.Popen(
+            proc = subprocess.Popen(
                 cmd, stdout=self.log_fd, stderr=self.log_fd, shell=shell)
-            rv = self.subproc.wait()
-            self.subproc = None
+            self.set_subproc(proc)
+            rv = self.wait_subproc(proc, cmd, shell, start, self.trace_tid())
+            self.set_subproc(None)
             self.log_fd.write("\n")
         except OSError as e:
             self.log_fd.write("%s\n" % str(e))
@@ -219,13 +704,58 @@ class ScanResults:
         self.handle_rv(rv)
         return rv
 
+    def exec_cmds(self, cmds, shell=True):
+        """execute the given commands in parallel and return the list of
+        their exit codes"""
+        self.handle_ec()
+        rvs = [0x7F] * len(cmds)
+        procs = []
+        start = self.trace_start()
+        for cmd in cmds:
+            if shell:
+                self.print_with_ts(shell_quote(cmd))
+            else:
+                self.print_with_ts(strlist_to_shell_cmd(cmd, escape_special=True))
+            try:
+                procs.append(subprocess.Popen(
+                    cmd, stdout=self.log_fd, stderr=self.log_fd, shell=shell))
+            except OSError as e:
+                self.log_fd.write("%s\n" % str(e))
+                procs.append(None)
+
+        # poll the commands if tracing, so that each of them is traced with
+        # its own end, wait for them in turn otherwise
+        options = os.WNOHANG if self.tracer is not None else 0
+        running = [i for (i, proc) in enumerate(procs) if proc is not None]
+        self.subprocs += [procs[i] for i in running]
+        while running:
+            for i in list(running):
+                status = wait_child(procs[i].pid, options)
+                if status is None:
+                    continue
+                (rvs[i], rusage) = status
+                procs[i].returncode = rvs[i]
+                self.account_child(rusage)
+                self.trace_cmd(cmds[i], shell, start, rvs[i], rusage, TRACE_TID_PARALLEL + i)
+                self.subprocs.remove(procs[i])
+                running.remove(i)
+            if running:
+                time.sleep(EXEC_CMDS_POLL_INTERVAL)
+        self.log_fd.write("\n")
+        for rv in rvs:
+            self.handle_rv(rv)
+        return rvs
+
     def get_cmd_output(self, cmd, shell=True):
         self.handle_ec()
-        self.subproc = subprocess.Popen(
+        start = self.trace_start()
+        proc = subprocess.Popen(
             cmd, stdout=subprocess.PIPE, stderr=self.log_fd, shell=shell)
-        (out, _) = self.subproc.communicate()
-        rv = self.subproc.returncode
-        self.subproc = None
+        self.set_subproc(proc)
+        out = proc.stdout.read()
+        proc.stdout.close()
+        rv = self.wait_subproc(proc, cmd, shell, start, self.trace_tid())
+        self.set_subproc(None)
         self.handle_rv(rv)
         out = out.decode("utf8")
         return (rv, out)
@@ -239,6 +769,8 @@ class IniWriter:
     def __init__(self, results):
         self.results = results
         self.ini = self.results.open_res_file("scan.ini")
+        # values written so far (recorded in the history of scans)
+        self.values = {}
         self.write("[scan]\n")
         self.append("tool", self.results.tool)
         self.append("tool-version", self.results.tool_version)
@@ -250,6 +782,12 @@ class IniWriter:
     def close(self):
         if self.ini is None:
             return
+
+        # wall-clock and CPU time [s] of the phases finished so far
+        for (key, wall, cpu) in phase_times(self.results.profile):
+            self.append("time-wall-%s" % key, "%.3f" % wall)
+            self.append("time-cpu-%s" % key, "%.3f" % cpu)
+
         self.append("time-finished", current_iso_date())
         self.append("exit-code", self.results.ec)
         self.ini.close()
@@ -260,6 +798,7 @@ class IniWriter:
         self.results.log_fd.write("scan.ini: " + text)
 
     def append(self, key, value):
+        self.values[key] = value
         self.write("%s = %s\n" % (key, value))
 
 
@@ -267,10 +806,34 @@ def transform_results(js_file, results):
     err_file  = re.sub("\\.js", ".err",  js_file)
     html_file = re.sub("\\.js", ".html", js_file)
     stat_file = re.sub("\\.js", "-summary.txt", js_file)
-    results.exec_cmd("csgrep --mode=grep %s '%s' > '%s'" %
-                     (CSGREP_FINAL_FILTER_ARGS, js_file,  err_file), shell=True)
-    results.exec_cmd("csgrep --mode=json %s '%s' | cshtml - > '%s'" %
-                     (CSGREP_FINAL_FILTER_ARGS, js_file, html_file), shell=True)
-    results.exec_cmd("csgrep --mode=evtstat %s '%s' | tee '%s'" % \
-                     (CSGREP_FINAL_FILTER_ARGS, err_file, stat_file), shell=True)
+
+    # read the results and apply the final filter only once, in-process
+    data = load_defects(js_file)
+    defects = list(prune_events(FINAL_FILTER.apply(data.get("defects", [])),
+                                FINAL_PRUNE_EVENTS))
+    data["defects"] = defects
+
+    # then produce all the output formats from the filtered list
+    results.print_with_ts("writing %s and %s" % (err_file, stat_file))
+    write_err(defects, err_file)
+    stats = event_stats(defects)
+    with open(stat_file, "w") as f:
+        f.write(stats)
+    results.log_fd.write(stats)
+
+    if results.use_paged_html:
+        # HTML page loading the defects on demand
+        items = [("defect", d) for d in defects]
+        if "scan" in data:
+            items.insert(0, ("scan", data["scan"]))
+        data_dir = write_paged_html(js_file, html_file, items=items)
+        results.print_with_ts("wrote %s and %s" % (html_file, data_dir))
+    else:
+        flt_file = os.path.join(results.tmpdir, os.path.basename(js_file))
+        dump_defects(data, flt_file)
+        results.exec_cmd("cshtml '%s' > '%s'" % (flt_file, html_file), shell=True)
+        os.remove(flt_file)
+
+    if results.use_ndjson:
+        results.print_with_ts("writing %s" % write_ndjson(js_file))
     return err_file, html_file
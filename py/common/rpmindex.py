@@ -0,0 +1,332 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+# format of the package headers and provides printed by RpmIndex.query_cmd()
+RPM_QUERY_FMT = "@ %{INSTALLTID} %{NAME} %|EPOCH?{%{EPOCH}}:{0}| %{VERSION} %{RELEASE} %{ARCH}\\n\
+[%{PROVIDENEVRS}\\n]"
+
+# list all installed packages but print provides only of those installed by
+# transactions not older than the given one
+RPM_QUERY_FILTER = "awk -v tid=%d '/^@ / { show = ($2 >= tid); print; next } show'"
+
+RICH_DEP_OPS = ["and", "or", "with", "without", "if", "unless", "else"]
+
+
+def rpmvercmp(a, b):
+    """compare two version (or release) strings the same way as rpm does"""
+    if a == b:
+        return 0
+    while a or b:
+        # tilde sorts before anything, even before the end of string
+        if a.startswith("~") or b.startswith("~"):
+            if not a.startswith("~"):
+                return 1
+            if not b.startswith("~"):
+                return -1
+            a = a[1:]
+            b = b[1:]
+            continue
+
+        # caret sorts after the end of string but before anything else
+        if a.startswith("^") or b.startswith("^"):
+            if not a:
+                return -1
+            if not b:
+                return 1
+            if not a.startswith("^"):
+                return 1
+            if not b.startswith("^"):
+                return -1
+            a = a[1:]
+            b = b[1:]
+            continue
+
+        # skip separators
+        a = re.sub("^[^a-zA-Z0-9~^]+", "", a)
+        b = re.sub("^[^a-zA-Z0-9~^]+", "", b)
+        if a.startswith(("~", "^")) or b.startswith(("~", "^")):
+            continue
+        if not a or not b:
+            break
+
+        if a[0].isdigit():
+            m_a = re.match("^[0-9]*", a)
+            m_b = re.match("^[0-9]*", b)
+            if not m_b.group(0):
+                # numeric segments are newer than alphabetic ones
+                return 1
+            seg_a = m_a.group(0).lstrip("0")
+            seg_b = m_b.group(0).lstrip("0")
+            if len(seg_a) != len(seg_b):
+                return 1 if len(seg_b) < len(seg_a) else -1
+        else:
+            m_a = re.match("^[a-zA-Z]*", a)
+            m_b = re.match("^[a-zA-Z]*", b)
+            if not m_b.group(0):
+                return -1
+            seg_a = m_a.group(0)
+            seg_b = m_b.group(0)
+
+        if seg_a != seg_b:
+            return 1 if seg_b < seg_a else -1
+        a = a[len(m_a.group(0)):]
+        b = b[len(m_b.group(0)):]
+
+    if not a and not b:
+        return 0
+    return 1 if a else -1
+
+
+def split_evr(evr):
+    """split [EPOCH:]VERSION[-RELEASE] into a triple, missing parts are None"""
+    epoch = None
+    m = re.match("^([0-9]+):(.*)$", evr)
+    if m is not None:
+        epoch = m.group(1)
+        evr = m.group(2)
+    release = None
+    if "-" in evr:
+        (evr, release) = evr.rsplit("-", 1)
+    return (epoch, evr, release)
+
+
+def compare_evr(a, b):
+    """compare two EVR triples, releases are compared only if both are known"""
+    rv = rpmvercmp(a[0] or "0", b[0] or "0")
+    if rv != 0:
+        return rv
+    rv = rpmvercmp(a[1], b[1])
+    if rv != 0 or a[2] is None or b[2] is None:
+        return rv
+    return rpmvercmp(a[2], b[2])
+
+
+def evr_matches(op, provided, required):
+    """return True if a provide of the given EVR triple satisfies 'op required'"""
+    rv = compare_evr(provided, required)
+    if op == "=":
+        return rv == 0
+    if op == "<":
+        return rv < 0
+    if op == "<=":
+        return rv <= 0
+    if op == ">":
+        return 0 < rv
+    if op == ">=":
+        return 0 <= rv
+    return False
+
+
+def tokenize_dep(dep):
+    """split a dependency into tokens, brackets of rich dependencies are separate
+    tokens whereas NAME(ARG) provides, such as perl(Carp), are kept as a whole"""
+    tokens = []
+    pos = 0
+    while pos < len(dep):
+        c = dep[pos]
+        if c.isspace():
+            pos += 1
+            continue
+        if c in "()":
+            # a bracket at the beginning of a token belongs to a rich dependency
+            tokens.append(c)
+            pos += 1
+            continue
+
+        # read the token up to a white-space or an unbalanced closing bracket
+        start = pos
+        depth = 0
+        while pos < len(dep) and not dep[pos].isspace():
+            if dep[pos] == "(":
+                depth += 1
+            elif dep[pos] == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            pos += 1
+        tokens.append(dep[start:pos])
+    return tokens
+
+
+class RpmIndex:
+    """index of packages and their provides installed in a chroot"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # NEVRA -> (INSTALLTID, NAME, EVR triple, ARCH)
+        self.pkgs = {}
+        # NEVRA -> list of provides as (NAME, OP, EVR triple)
+        self.pkg_provides = {}
+        # NAME -> list of (OP, EVR triple), built lazily from pkg_provides
+        self.provides = None
+        self.last_tid = 0
+
+    def query_cmd(self):
+        """shell command to run in the chroot to get the data for update()"""
+        return "rpm -qa --qf '%s' | %s" % (RPM_QUERY_FMT, RPM_QUERY_FILTER % self.last_tid)
+
+    def update(self, out):
+        """update the index by output of query_cmd()"""
+        pkgs = {}
+        provides = {}
+        nevra = None
+        for line in out.splitlines():
+            if line.startswith("@ "):
+                fields = line.split()
+                if len(fields) != 7:
+                    nevra = None
+                    continue
+                (_, tid, name, epoch, version, release, arch) = fields
+                nevra = "%s-%s:%s-%s.%s" % (name, epoch, version, release, arch)
+                pkgs[nevra] = (int(tid), name, (epoch, version, release), arch)
+                if nevra in self.pkg_provides:
+                    # already known, no need to parse its provides again
+                    provides[nevra] = self.pkg_provides[nevra]
+                    nevra = None
+                else:
+                    provides[nevra] = []
+                continue
+
+            if nevra is None or not line.strip():
+                continue
+            fields = line.split()
+            if len(fields) == 3:
+                provides[nevra].append((fields[0], fields[1], split_evr(fields[2])))
+            else:
+                provides[nevra].append((fields[0], None, None))
+
+        self.pkgs = pkgs
+        self.pkg_provides = provides
+        self.provides = None
+        for (tid, _, _, _) in pkgs.values():
+            if self.last_tid < tid:
+                self.last_tid = tid
+
+    def get_provides(self, name):
+        if self.provides is None:
+            self.provides = {}
+            for plist in self.pkg_provides.values():
+                for (pname, op, evr) in plist:
+                    self.provides.setdefault(pname, []).append((op, evr))
+        return self.provides.get(name, [])
+
+    def is_provided(self, name, op=None, evr=None):
+        """return True if the given (optionally versioned) dependency is satisfied"""
+        if name.startswith("/"):
+            # file dependencies are not indexed, assume they are satisfied
+            return True
+        for (p_op, p_evr) in self.get_provides(name):
+            if op is None or p_evr is None:
+                # unversioned provides/requires always overlap
+                return True
+            if p_op == "=" and evr_matches(op, p_evr, split_evr(evr)):
+                return True
+            if p_op != "=":
+                # ranges in provides are rare, be optimistic about them
+                return True
+        return False
+
+    def is_satisfied(self, dep):
+        """return True if the given dependency (including rich ones) is satisfied"""
+        tokens = tokenize_dep(dep)
+        try:
+            (rv, pos) = self.eval_tokens(tokens, 0)
+        except (IndexError, ValueError):
+            # unable to parse the dependency, let the package manager resolve it
+            return False
+        return rv if pos == len(tokens) else False
+
+    def eval_tokens(self, tokens, pos):
+        """evaluate a single (possibly rich) dependency starting at tokens[pos]"""
+        if tokens[pos] != "(":
+            # simple dependency: NAME [OP EVR]
+            name = tokens[pos]
+            pos += 1
+            if pos + 1 < len(tokens) and tokens[pos] in ["<", "<=", "=", ">=", ">"]:
+                return (self.is_provided(name, tokens[pos], tokens[pos + 1]), pos + 2)
+            return (self.is_provided(name), pos)
+
+        # rich dependency: ( DEP OP DEP [OP DEP ...] )
+        (rv, pos) = self.eval_tokens(tokens, pos + 1)
+        operands = [rv]
+        ops = []
+        while tokens[pos] != ")":
+            op = tokens[pos]
+            if op not in RICH_DEP_OPS:
+                raise ValueError("unknown operator in rich dependency: %s" % op)
+            (rv, pos) = self.eval_tokens(tokens, pos + 1)
+            ops.append(op)
+            operands.append(rv)
+        pos += 1
+
+        op = ops[0] if ops else None
+        if op == "and":
+            return (all(operands), pos)
+        if op == "or":
+            return (any(operands), pos)
+        if op == "with":
+            # approximation: we do not check that the same package provides both
+            return (operands[0] and operands[1], pos)
+        if op == "without":
+            return (operands[0] and not operands[1], pos)
+        if op == "if":
+            # (A if B [else C])
+            if operands[1]:
+                return (operands[0], pos)
+            return (operands[2] if len(operands) > 2 else True, pos)
+        if op == "unless":
+            # (A unless B [else C])
+            if not operands[1]:
+                return (operands[0], pos)
+            return (operands[2] if len(operands) > 2 else True, pos)
+        return (operands[0], pos)
+
+    def find_pkg_version(self, name):
+        """return VERSION of the installed package of the given name, or None"""
+        versions = [evr[1] for (_, pname, evr, _) in self.pkgs.values() if pname == name]
+        if not versions:
+            return None
+        return sorted(versions, key=version_sort_key)[0]
+
+    def get_rpm_file_names(self):
+        """return set of file names of the installed packages"""
+        names = set()
+        for (_, name, evr, arch) in self.pkgs.values():
+            if arch != "(none)":
+                names.add("%s-%s-%s.%s.rpm" % (name, evr[1], evr[2], arch))
+        return names
+
+    def write_pkg_list(self, fname):
+        """write list of installed packages in the format of 'rpm -qa | sort -V'"""
+        lines = []
+        for (_, name, evr, arch) in self.pkgs.values():
+            nvra = "%s-%s-%s" % (name, evr[1], evr[2])
+            if arch != "(none)":
+                nvra += ".%s" % arch
+            lines.append(nvra)
+        with open(fname, "w") as f:
+            for nvra in sorted(lines, key=version_sort_key):
+                f.write("%s\n" % nvra)
+
+
+def version_sort_key(s):
+    """approximation of the ordering used by 'sort -V'"""
+    return [(0, int(seg), "") if seg.isdigit() else (1, 0, seg)
+            for seg in re.findall("[0-9]+|[^0-9]+", s)]
@@ -15,8 +15,6 @@
 # You should have received a copy of the GNU General Public License
 # along with csmock.  If not, see <http://www.gnu.org/licenses/>.
 
-import re
-
 
 def shell_quote(str_in):
     str_out = ""
@@ -48,14 +46,13 @@ def strlist_to_shell_cmd(cmd_in, escape_special=False):
 
 
 def write_toolver_from_rpmlist(results, mock, tool, tool_key):
-    cmd = "grep '^%s-[0-9]' %s/rpm-list-mock.txt" % (tool, results.dbgdir)
-    (rc, nvr) = results.get_cmd_output(cmd)
-    if rc != 0:
+    # look up the version in the index of packages installed in the chroot
+    ver = mock.get_rpm_index().find_pkg_version(tool)
+    if ver is None:
         results.error("tool \"%s\" does not seem to be installed in build root" \
                 % tool, ec=0)
-        return rc
+        return 1
 
-    ver = re.sub("-[0-9].*$", "", re.sub("^%s-" % tool, "", nvr.strip()))
     results.ini_writer.append("analyzer-version-%s" % tool_key, ver)
     return 0
 
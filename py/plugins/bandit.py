@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with csmock.  If not, see <http://www.gnu.org/licenses/>.
 
+import csmock.common.hooks
 import csmock.common.util
 
 
@@ -68,7 +69,8 @@ class Plugin:
 
         severity_filter = dict(zip(self._severity_levels, ['-l', '-ll', '-lll']))[args.bandit_severity_filter.upper()]
         run_cmd = "%s %s %s > %s" % (RUN_BANDIT_SH, severity_filter, dirs_to_scan, BANDIT_CAPTURE)
-        props.post_build_chroot_cmds += [run_cmd]
+        props.post_build_chroot_cmds += [csmock.common.hooks.Hook(
+            run_cmd, inputs=dirs_to_scan.split(), outputs=[BANDIT_CAPTURE])]
         props.copy_out_files += [BANDIT_CAPTURE]
 
         csmock.common.util.install_default_toolver_hook(props, "bandit")
@@ -79,4 +81,5 @@ class Plugin:
             cmd = FILTER_CMD % (src, args.bandit_evt_filter, dst)
             return results.exec_cmd(cmd, shell=True)
 
-        props.post_process_hooks += [filter_hook]
+        props.post_process_hooks += [csmock.common.hooks.Hook(
+            filter_hook, inputs=[BANDIT_CAPTURE], outputs=["bandit-capture.err"])]
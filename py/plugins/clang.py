@@ -22,6 +22,7 @@ import subprocess
 # local imports
 import csmock.common.cflags
 import csmock.common.util
+from csmock.common.defects import DefectFilter
 
 
 class PluginProps:
@@ -57,7 +58,7 @@ class Plugin:
             props.env["CSCLNG_ADD_OPTS"] = csmock.common.cflags.serialize_flags(args.clang_add_flag)
 
         props.cswrap_filters += \
-                ["csgrep --mode=json --invert-match --checker CLANG_WARNING --event error"]
+                [DefectFilter(invert_match=True, checker="CLANG_WARNING", event="error")]
 
         props.install_pkgs += ["clang"]
 
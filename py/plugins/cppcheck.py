@@ -21,6 +21,7 @@ import subprocess
 
 # local imports
 import csmock.common.cflags
+from csmock.common.defects import DefectFilter
 
 
 class PluginProps:
@@ -61,9 +62,9 @@ class Plugin:
 
         props.enable_cswrap()
         props.env["CSWRAP_TIMEOUT_FOR"] += ":cppcheck"
-        props.cswrap_filters += ["csgrep --mode=json --invert-match \
---checker CPPCHECK_WARNING \
---event 'cppcheckError|internalAstError|preprocessorErrorDirective|syntaxError'"]
+        props.cswrap_filters += [DefectFilter(
+            invert_match=True, checker="CPPCHECK_WARNING",
+            event="cppcheckError|internalAstError|preprocessorErrorDirective|syntaxError")]
 
         if args.cppcheck_add_flag:
             # propagate custom cppcheck flags
@@ -98,8 +99,7 @@ class Plugin:
             props.install_pkgs += ["cppcheck"]
 
         def store_cppcheck_version_hook(results, mock):
-            cmd = mock.get_mock_cmd(["--chroot", "cppcheck --version"])
-            (rc, verstr) = results.get_cmd_output(cmd, shell=False)
+            (rc, verstr) = mock.get_chroot_cmd_output("cppcheck --version")
             if rc != 0:
                 return rc
 
@@ -22,6 +22,7 @@ import subprocess
 import csmock.common.util
 
 from csmock.common.cflags import add_custom_flag_opts, flags_by_warning_level
+from csmock.common.defects import DefectFilter
 
 CSGCCA_BIN="/usr/bin/csgcca"
 
@@ -144,12 +145,12 @@ class Plugin:
         if not self.enabled:
             # drop COMPILER_WARNING defects mistakenly enabled by other plug-ins
             props.cswrap_filters += \
-                ["csgrep --mode=json --invert-match --checker COMPILER_WARNING"]
+                [DefectFilter(invert_match=True, checker="COMPILER_WARNING")]
             return
 
         props.enable_cswrap()
         props.cswrap_filters += \
-            ["csgrep --mode=json --invert-match --checker COMPILER_WARNING --event error"]
+            [DefectFilter(invert_match=True, checker="COMPILER_WARNING", event="error")]
 
         # write all compiler flags to the environment
         self.flags.write_to_env(props.env)
@@ -1,3 +1,4 @@
+import csmock.common.hooks
 import csmock.common.util
 import re
 import os
@@ -87,13 +88,20 @@ class Plugin:
             if not infer_archive:
                 parser.error("Default infer archive path \"/opt/infer-linux*.tar.xz\" doesn't exist")
 
-        props.copy_in_files += [infer_archive]
+        if not props.payload_cache:
+            props.copy_in_files += [infer_archive]
         props.copy_in_files += [INFER_INSTALL_SCRIPT]
         props.copy_in_files += [INFER_RESULTS_FILTER_SCRIPT]
 
         # install infer and wrappers for a capture phase of infer
         install_cmd = "%s %s" % (INFER_INSTALL_SCRIPT, infer_archive)
         def install_infer_hook(results, mock):
+            if mock.payloads is not None:
+                # use Infer extracted in the payload cache
+                infer_dir = mock.payloads.extract(infer_archive)
+                if infer_dir is None:
+                    return 1
+                return mock.exec_chroot_cmd("%s %s" % (INFER_INSTALL_SCRIPT, infer_dir))
             return mock.exec_chroot_cmd(install_cmd)
         props.post_depinst_hooks += [install_infer_hook]
 
@@ -101,7 +109,8 @@ class Plugin:
         infer_analyze_flags = csmock.common.cflags.serialize_flags(args.infer_analyze_add_flag, separator=" ")
         run_cmd = "echo 'NOTE: INFER: running analysis phase' && "
         run_cmd += "infer analyze --keep-going %s -o %s" % (infer_analyze_flags, INFER_OUT_DIR)
-        props.post_build_chroot_cmds += [run_cmd]
+        props.post_build_chroot_cmds += [csmock.common.hooks.Hook(
+            run_cmd, inputs=[INFER_OUT_DIR], outputs=[INFER_OUT_DIR])]
 
         filter_args = []
 
@@ -129,7 +138,8 @@ class Plugin:
         # the filter script tries to filter out false positives and transforms results into csdiff compatible format
         filter_cmd = "python %s %s < %s/report.json > %s" % (INFER_RESULTS_FILTER_SCRIPT, filter_args_serialized, INFER_OUT_DIR, INFER_RESULTS)
 
-        props.post_build_chroot_cmds += [filter_cmd]
+        props.post_build_chroot_cmds += [csmock.common.hooks.Hook(
+            filter_cmd, inputs=[INFER_OUT_DIR], outputs=[INFER_RESULTS])]
 
         props.copy_out_files += [INFER_AST_LOG]
         props.copy_out_files += [INFER_AST_DIR]
@@ -141,4 +151,5 @@ class Plugin:
             cmd = CSGREP_CMD % (src, dst)
             return results.exec_cmd(cmd, shell=True, echo=True)
 
-        props.post_process_hooks += [filter_hook]
+        props.post_process_hooks += [csmock.common.hooks.Hook(
+            filter_hook, inputs=[INFER_RESULTS], outputs=["infer-results.err"])]
@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with csmock.  If not, see <http://www.gnu.org/licenses/>.
 
+import csmock.common.hooks
 import csmock.common.util
 
 
@@ -62,7 +63,8 @@ class Plugin:
         props.install_pkgs += ["pylint"]
         props.copy_in_files += [RUN_PYLINT_SH]
         cmd = "%s %s > %s" % (RUN_PYLINT_SH, dirs_to_scan, PYLINT_CAPTURE)
-        props.post_build_chroot_cmds += [cmd]
+        props.post_build_chroot_cmds += [csmock.common.hooks.Hook(
+            cmd, inputs=dirs_to_scan.split(), outputs=[PYLINT_CAPTURE])]
         props.copy_out_files += [PYLINT_CAPTURE]
 
         csmock.common.util.install_default_toolver_hook(props, "pylint")
@@ -73,4 +75,5 @@ class Plugin:
             cmd = FILTER_CMD % (src, args.pylint_evt_filter, dst)
             return results.exec_cmd(cmd, shell=True)
 
-        props.post_process_hooks += [filter_hook]
+        props.post_process_hooks += [csmock.common.hooks.Hook(
+            filter_hook, inputs=[PYLINT_CAPTURE], outputs=["pylint-capture.err"])]
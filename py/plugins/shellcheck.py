@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with csmock.  If not, see <http://www.gnu.org/licenses/>.
 
+import csmock.common.hooks
 import csmock.common.util
 
 
@@ -57,7 +58,8 @@ class Plugin:
         props.install_pkgs += ["ShellCheck"]
         props.copy_in_files += [RUN_SHELLCHECK_SH]
         cmd = "%s %s > %s" % (RUN_SHELLCHECK_SH, dirs_to_scan, SHELLCHECK_CAPTURE)
-        props.post_build_chroot_cmds += [cmd]
+        props.post_build_chroot_cmds += [csmock.common.hooks.Hook(
+            cmd, inputs=dirs_to_scan.split(), outputs=[SHELLCHECK_CAPTURE])]
         props.copy_out_files += [SHELLCHECK_CAPTURE]
 
         csmock.common.util.install_default_toolver_hook(props, "ShellCheck")
@@ -68,4 +70,5 @@ class Plugin:
             cmd = FILTER_CMD % (src, dst)
             return results.exec_cmd(cmd, shell=True)
 
-        props.post_process_hooks += [filter_hook]
+        props.post_process_hooks += [csmock.common.hooks.Hook(
+            filter_hook, inputs=[SHELLCHECK_CAPTURE], outputs=["shellcheck-capture.err"])]
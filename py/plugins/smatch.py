@@ -21,6 +21,7 @@ import subprocess
 
 # local imports
 import csmock.common.util
+from csmock.common.defects import DefectFilter
 
 
 class PluginProps:
@@ -51,7 +52,7 @@ class Plugin:
         props.enable_cswrap()
         props.env["CSWRAP_TIMEOUT_FOR"] += ":smatch"
         props.cswrap_filters += \
-                ["csgrep --mode=json --invert-match --checker SMATCH_WARNING --event error"]
+                [DefectFilter(invert_match=True, checker="SMATCH_WARNING", event="error")]
 
         props.install_pkgs += ["smatch"]
 
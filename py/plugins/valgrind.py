@@ -16,6 +16,7 @@
 # along with csmock.  If not, see <http://www.gnu.org/licenses/>.
 
 import csmock.common.cflags
+import csmock.common.hooks
 import csmock.common.util
 
 
@@ -104,7 +105,8 @@ class Plugin:
         def cleanup_hook(results):
             return results.exec_cmd(["find", results.dbgdir_raw + VALGRIND_CAPTURE_DIR,
                 "-name", "pid-*.log", "-empty", "-delete"])
-        props.post_process_hooks += [cleanup_hook]
+        props.post_process_hooks += [csmock.common.hooks.Hook(
+            cleanup_hook, inputs=[VALGRIND_CAPTURE_DIR], outputs=[VALGRIND_CAPTURE_DIR])]
 
         # transform XML files produced by valgrind into csdiff format
         def filter_hook(results):
@@ -113,4 +115,5 @@ class Plugin:
             cmd = "csgrep --mode=json --quiet --remove-duplicates '%s'/*.xml > '%s'" \
                     % (src_dir, dst)
             return results.exec_cmd(cmd, shell=True)
-        props.post_process_hooks += [filter_hook]
+        props.post_process_hooks += [csmock.common.hooks.Hook(
+            filter_hook, inputs=[VALGRIND_CAPTURE_DIR], outputs=["valgrind-capture.js"])]
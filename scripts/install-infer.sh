@@ -97,18 +97,30 @@ then
   exit 1
 fi
 
-if ! tar -xf $1 -C /opt
+if [ -d "$1" ]
 then
-  echo "ERROR: INFER: install-infer.sh: Failed to extract an Infer archive $1"
-  exit 1
-fi
+  # Infer already extracted in a directory shared with other chroots
+  INFER_DIR=$(ls "$1" | grep infer-linux | head -n 1)
 
-INFER_DIR=$(ls /opt | grep infer-linux | head -n 1)
+  if ! ln -sfn "$1/${INFER_DIR}" "/opt/${INFER_DIR}"
+  then
+    echo "ERROR: INFER: install-infer.sh: Failed to create a symlink to $1/${INFER_DIR}"
+    exit 1
+  fi
+else
+  if ! tar -xf $1 -C /opt
+  then
+    echo "ERROR: INFER: install-infer.sh: Failed to extract an Infer archive $1"
+    exit 1
+  fi
 
-if ! rm $1
-then
-  echo "ERROR: INFER: install-infer.sh: Failed to delete an Infer archive $1"
-  exit 1
+  INFER_DIR=$(ls /opt | grep infer-linux | head -n 1)
+
+  if ! rm $1
+  then
+    echo "ERROR: INFER: install-infer.sh: Failed to delete an Infer archive $1"
+    exit 1
+  fi
 fi
 
 if [ -f /usr/bin/infer ] || ln -s /opt/${INFER_DIR}/bin/infer /usr/bin/infer
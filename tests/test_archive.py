@@ -0,0 +1,73 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from csmock.common.archive import decompress
+from csmock.common.archive import read_member
+from csmock.common.archive import write_archive
+
+
+class TestWriteArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_codec(self, codec):
+        if shutil.which(codec) is None:
+            self.skipTest("%s not available" % codec)
+
+        res_dir = os.path.join(self.tmp_dir, "res")
+        os.makedirs(os.path.join(res_dir, "debug", "raw"))
+        with open(os.path.join(res_dir, "scan.ini"), "w") as f:
+            f.write("[scan]\n")
+        with open(os.path.join(res_dir, "debug", "raw", "out.js"), "w") as f:
+            f.write("{}\n")
+        os.symlink("debug/raw", os.path.join(res_dir, "raw"))
+        os.symlink("scan.ini", os.path.join(res_dir, "scan.lnk"))
+
+        archive = os.path.join(self.tmp_dir, "res.tar.%s" % codec)
+        write_archive(archive, self.tmp_dir, "res", codec, jobs=2)
+        self.assertEqual(read_member(archive, "res/scan.ini"), b"[scan]\n")
+        self.assertEqual(read_member(archive, "res/debug/raw/out.js"), b"{}\n")
+
+        # no temporary file is left next to the archive
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["res", os.path.basename(archive)])
+
+        # the archive is readable by tar, including the symlinks
+        with open(archive, "rb") as f:
+            data = f.read()
+        with tarfile.open(fileobj=io.BytesIO(decompress(data, codec))) as tar:
+            links = dict((m.name, m.linkname) for m in tar.getmembers() if m.issym())
+        self.assertEqual(links, {"res/raw": "debug/raw", "res/scan.lnk": "scan.ini"})
+
+    def test_xz(self):
+        self.check_codec("xz")
+
+    def test_zstd(self):
+        self.check_codec("zstd")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from csmock.common.defects import defect_fingerprint
+from csmock.common.defects import KfpFilter
+from csmock.common.defects import diff_defects
+from csmock.common.defects import event_stats
+from csmock.common.defects import format_defect
+from csmock.common.defects import prune_events
+
+
+def make_defect(checker, path, line, msg):
+    return {"checker": checker, "events": [
+        {"file_name": path, "line": line, "event": "warning", "message": msg}]}
+
+
+class TestDiffDefects(unittest.TestCase):
+    def test_line_numbers(self):
+        old = [make_defect("A", "/a/x.c", 10, "bad thing at x.c:10")]
+        new = [make_defect("A", "/a/x.c", 20, "bad thing at x.c:20")]
+        self.assertEqual(diff_defects(old, new), ([], [], new))
+
+    def test_duplicates(self):
+        d = make_defect("A", "x.c", 1, "bad")
+        (fixed, added, unchanged) = diff_defects([d], [d, d])
+        self.assertEqual((len(fixed), len(added), len(unchanged)), (0, 1, 1))
+
+        (fixed, added, unchanged) = diff_defects([d, d, d], [d])
+        self.assertEqual((len(fixed), len(added), len(unchanged)), (2, 0, 1))
+
+    def test_version_dir(self):
+        old = [make_defect("A", "/builddir/build/BUILD/a-1.0/src/x.c", 1, "bad")]
+        new = [make_defect("A", "a-1.1/src/x.c", 1, "bad"),
+               make_defect("A", "a-1.1/lib/x.c", 1, "bad")]
+        self.assertEqual(diff_defects(old, new), ([], new[1:], new[:1]))
+
+    def test_ignore_path(self):
+        old = [make_defect("A", "/a-1.0/src/x.c", 1, "bad")]
+        new = [make_defect("A", "/a-1.1/lib/x.c", 1, "bad"),
+               make_defect("B", "/a-1.1/lib/x.c", 1, "bad")]
+        self.assertEqual(diff_defects(old, new), (old, new, []))
+        self.assertEqual(diff_defects(old, new, ignore_path=True), ([], new[1:], new[:1]))
+
+    def test_missing_fields(self):
+        old = [{"checker": "A", "events": []}]
+        new = [{"checker": "A", "events": [{"event": "warning"}]},
+               {"checker": "A", "key_event_idx": 1, "events": []}]
+        self.assertEqual(defect_fingerprint(old[0]), ("A", "", "", ""))
+        self.assertEqual(diff_defects(old, new), ([], new[:1], new[1:]))
+
+
+class TestTransform(unittest.TestCase):
+    def test_prune_events(self):
+        defect = make_defect("A", "x.c", 1, "bad")
+        defect["events"] = [
+            {"file_name": "x.c", "line": 1, "event": "note", "message": "a", "verbosity_level": 1},
+            {"file_name": "x.c", "line": 2, "event": "note", "message": "b"},
+            {"file_name": "x.c", "line": 3, "event": "warning", "message": "c", "verbosity_level": 1}]
+        defect["key_event_idx"] = 2
+        (pruned,) = prune_events([defect], 1)
+        self.assertEqual([e["message"] for e in pruned["events"]], ["b", "c"])
+        self.assertEqual(pruned["key_event_idx"], 1)
+
+    def test_format_defect(self):
+        defect = make_defect("A", "x.c", 1, "bad")
+        defect["cwe"] = 563
+        defect["events"].append({"file_name": "x.c", "line": 0, "event": "#", "message": " 1| x"})
+        self.assertEqual(format_defect(defect), "Error: A (CWE-563):\nx.c:1: warning: bad\n# 1| x\n")
+
+    def test_event_stats(self):
+        defects = [make_defect("B", "x.c", 1, "bad"), make_defect("A", "x.c", 2, "bad"),
+                   make_defect("B", "y.c", 1, "bad")]
+        self.assertEqual(event_stats(defects), "       1\tA\twarning\n       2\tB\twarning\n")
+
+
+class FakeResults:
+    """the subset of ScanResults used by KfpFilter, with csgrep replaced by cat"""
+    def exec_cmd(self, cmd, shell=False):
+        return os.system(cmd.replace("csgrep --mode=json --quiet", "cat"))
+
+    def print_with_ts(self, msg):
+        pass
+
+
+class TestKfpFilter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_new_version(self):
+        kfp = [make_defect("A", "/builddir/build/BUILD/a-1.0/src/x.c", 10, "bad")]
+        source = os.path.join(self.tmpdir, "kfp.js")
+        with open(source, "w") as f:
+            json.dump({"defects": kfp}, f)
+
+        flt = KfpFilter(source, self.tmpdir)
+        flt.prepare(FakeResults())
+        defects = [make_defect("A", "/builddir/build/BUILD/a-1.1/src/x.c", 20, "bad"),
+                   make_defect("A", "/builddir/build/BUILD/a-1.1/lib/x.c", 10, "bad")]
+        self.assertEqual(list(flt.apply(defects)), defects[1:])
+        flt.finish(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
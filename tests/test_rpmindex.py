@@ -0,0 +1,124 @@
+# Copyright (C) 2021 Red Hat, Inc.
+#
+# This file is part of csmock.
+#
+# csmock is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# csmock is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with csmock.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from csmock.common.rpmindex import RpmIndex
+from csmock.common.rpmindex import compare_evr
+from csmock.common.rpmindex import rpmvercmp
+from csmock.common.rpmindex import tokenize_dep
+
+
+def make_index(provides):
+    """create an index of a single package providing the given NAME [OP EVR]"""
+    out = "@ 1 pkg 0 1.0 1 x86_64\n" + "\n".join(provides) + "\n"
+    index = RpmIndex()
+    index.update(out)
+    return index
+
+
+class TestRpmVerCmp(unittest.TestCase):
+    def test_equal(self):
+        for ver in ["1.0", "1.0a", "1.0~rc1", "1.0^git1", "1_0"]:
+            self.assertEqual(rpmvercmp(ver, ver), 0)
+        self.assertEqual(rpmvercmp("1.0", "1_0"), 0)
+        self.assertEqual(rpmvercmp("1.01", "1.1"), 0)
+
+    def test_order(self):
+        # pairs of (lower, higher) versions as ordered by rpm
+        for (a, b) in [
+                ("1.0", "1.0.1"),
+                ("1.9", "1.10"),
+                ("1.0a", "1.0.1"),
+                ("a", "1"),
+                ("1.0~rc1", "1.0"),
+                ("1.0~rc1", "1.0~rc2"),
+                ("1.0", "1.0^git1"),
+                ("1.0^git1", "1.0.1"),
+                ("1.0^", "1.0^git1"),
+                ("2.0.0", "10.0.0"),
+                ("1.0", "1.00001"),
+                ("0001", "2")]:
+            self.assertEqual(rpmvercmp(a, b), -1, "%s < %s" % (a, b))
+            self.assertEqual(rpmvercmp(b, a), 1, "%s > %s" % (b, a))
+
+    def test_evr(self):
+        self.assertEqual(compare_evr(("1", "1.0", "1"), ("0", "2.0", "1")), 1)
+        self.assertEqual(compare_evr(("0", "1.0", "1"), ("0", "1.0", "2")), -1)
+        self.assertEqual(compare_evr(("0", "1.0", "1"), ("0", "1.0", None)), 0)
+
+
+class TestTokenizeDep(unittest.TestCase):
+    def test_simple(self):
+        self.assertEqual(tokenize_dep("foo"), ["foo"])
+        self.assertEqual(tokenize_dep("foo >= 1.0"), ["foo", ">=", "1.0"])
+
+    def test_name_arg(self):
+        self.assertEqual(tokenize_dep("perl(Carp)"), ["perl(Carp)"])
+        self.assertEqual(tokenize_dep("pkgconfig(glib-2.0) >= 2.0"),
+                         ["pkgconfig(glib-2.0)", ">=", "2.0"])
+        self.assertEqual(tokenize_dep("libc.so.6(GLIBC_2.34)(64bit)"),
+                         ["libc.so.6(GLIBC_2.34)(64bit)"])
+
+    def test_rich(self):
+        self.assertEqual(tokenize_dep("(pkgconfig(x) or bar)"),
+                         ["(", "pkgconfig(x)", "or", "bar", ")"])
+        self.assertEqual(tokenize_dep("((a and b) or perl(C) >= 1)"),
+                         ["(", "(", "a", "and", "b", ")", "or", "perl(C)", ">=", "1", ")"])
+
+
+class TestIsSatisfied(unittest.TestCase):
+    def test_empty_index(self):
+        index = RpmIndex()
+        for dep in ["foo", "perl(Carp)", "pkgconfig(glib-2.0) >= 2.0",
+                    "(pkgconfig(x) or bar)", "(foo and bar)"]:
+            self.assertFalse(index.is_satisfied(dep), dep)
+
+        # file dependencies are not indexed
+        self.assertTrue(index.is_satisfied("/usr/bin/sh"))
+
+    def test_name_arg(self):
+        index = make_index(["perl(Carp) = 1.50", "pkgconfig(glib-2.0) = 2.70.0"])
+        self.assertTrue(index.is_satisfied("perl(Carp)"))
+        self.assertTrue(index.is_satisfied("perl(Carp) >= 1.2"))
+        self.assertFalse(index.is_satisfied("perl(Carp) >= 2"))
+        self.assertFalse(index.is_satisfied("perl(Exporter)"))
+        self.assertTrue(index.is_satisfied("pkgconfig(glib-2.0) >= 2.0"))
+        self.assertFalse(index.is_satisfied("pkgconfig(glib-2.0) > 2.70.0"))
+
+    def test_rich(self):
+        index = make_index(["foo = 1.0-1", "pkgconfig(x)"])
+        self.assertTrue(index.is_satisfied("(pkgconfig(x) or bar)"))
+        self.assertTrue(index.is_satisfied("(bar or foo >= 1.0)"))
+        self.assertFalse(index.is_satisfied("(pkgconfig(x) and bar)"))
+        self.assertTrue(index.is_satisfied("(foo with pkgconfig(x))"))
+        self.assertFalse(index.is_satisfied("(foo without pkgconfig(x))"))
+        self.assertTrue(index.is_satisfied("(bar if baz)"))
+        self.assertFalse(index.is_satisfied("(bar if foo)"))
+        self.assertTrue(index.is_satisfied("(bar if baz else foo)"))
+        self.assertFalse(index.is_satisfied("(bar unless baz)"))
+        self.assertTrue(index.is_satisfied("((bar or foo) and pkgconfig(x))"))
+
+    def test_unparsable(self):
+        index = make_index(["foo", "bar"])
+        self.assertFalse(index.is_satisfied("(foo xor bar)"))
+        self.assertFalse(index.is_satisfied("(foo or bar"))
+        self.assertFalse(index.is_satisfied("foo bar"))
+
+
+if __name__ == '__main__':
+    unittest.main()